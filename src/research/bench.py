@@ -0,0 +1,423 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+
+logger = logging.getLogger(__name__)
+
+# One question per benchmarked path. The fake LLM routes on "copyright" and
+# classifies "fill" as a command, and every request gets a numbered variant so
+# the embedding cache sees distinct inputs.
+SCENARIOS = {
+    "vectorstore": "What rights do performers get under the Copyright Act",
+    "websearch": "Who won the cricket world cup final",
+    "command": "Fill the copyright registration form for me",
+}
+EMBEDDING_DIMENSIONS = 1024
+
+# Calls made to the fakes, read before and after each run
+fake_calls = {"llm": 0, "embedding": 0, "search": 0}
+
+
+class Latency:
+    """
+    Normally distributed latency in seconds, clipped at zero and drawn from a
+    seeded generator so runs are repeatable.
+    """
+
+    def __init__(self, mean, stddev=0.0, seed=0):
+        self.mean = mean
+        self.stddev = stddev
+        self._random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec, seed=0):
+        """
+        Args:
+            spec (str): "MEAN" or "MEAN:STDDEV", in seconds
+            seed (int): Seed of the generator
+        """
+        mean, _, stddev = spec.partition(":")
+        return cls(float(mean), float(stddev or 0), seed)
+
+    def sample(self):
+        if not self.stddev:
+            return self.mean
+        return max(0.0, self._random.gauss(self.mean, self.stddev))
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+    async def asleep(self):
+        await asyncio.sleep(self.sample())
+
+
+def _question_in(prompt, marker):
+    return prompt.split(marker, 1)[-1].lower()
+
+
+def fake_reply(prompt):
+    """
+    Deterministic answer of the fake LLM, picked from the prompt template of
+    the chain calling it.
+    """
+    if "Question to route:" in prompt:
+        question = _question_in(prompt, "Question to route:")
+        datasource = "vectorstore" if "copyright" in question else "web_search"
+        return json.dumps({"datasource": datasource})
+    if "Here is the question/query:" in prompt:
+        question = _question_in(prompt, "Here is the question/query:")
+        intent = "command" if "fill" in question else "question_answering"
+        return json.dumps({"intent": intent})
+    if "keys 'grounded' and 'useful'" in prompt:
+        return json.dumps({"grounded": "yes", "useful": "yes"})
+    if "grader" in prompt:
+        return json.dumps({"score": "yes"})
+    return (
+        "The Copyright Act, 1957 grants performers the exclusive right to record "
+        "and broadcast their performances for fifty years."
+    )
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Stand-in for ChatGroq that sleeps for the configured latency and answers
+    with fake_reply, streamed one word per chunk when streaming.
+    """
+
+    latency: Any = None
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _result(self, messages):
+        fake_calls["llm"] += 1
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = fake_reply(prompt)
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": len(prompt) // 4,
+                "output_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.latency.sleep()
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await self.latency.asleep()
+        return self._result(messages)
+
+    def _chunks(self, messages):
+        message = self._result(messages).generations[0].message
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content=word if last else word + " ",
+                    usage_metadata=message.usage_metadata if last else None,
+                )
+            )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.latency.sleep()
+        for chunk in self._chunks(messages):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await self.latency.asleep()
+        for chunk in self._chunks(messages):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Stand-in for CohereEmbeddings returning a unit vector seeded by the text,
+    with one latency sample per call.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    @staticmethod
+    def _vector(text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        fake_calls["embedding"] += 1
+        self.latency.sleep()
+        return [self._vector(text) for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        fake_calls["embedding"] += 1
+        await self.latency.asleep()
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeSearchTool(BaseTool):
+    """
+    Stand-in for TavilySearchResults returning three fixed results.
+    """
+
+    name: str = "tavily_search_results_json"
+    description: str = "Offline stand-in for Tavily search"
+    latency: Any = None
+
+    def _results(self, query):
+        fake_calls["search"] += 1
+        return [
+            {"url": f"https://example.com/{i}", "content": f"Result {i} for {query}."}
+            for i in range(3)
+        ]
+
+    def _run(self, query: str, run_manager=None):
+        self.latency.sleep()
+        return self._results(query)
+
+    async def _arun(self, query: str, run_manager=None):
+        await self.latency.asleep()
+        return self._results(query)
+
+
+def install_fakes(llm_latency, embedding_latency, search_latency):
+    """
+    Replace ChatGroq, CohereEmbeddings and TavilySearchResults with the fakes.
+    Must run before the first request, when the resources registry builds
+    `llm`, `embeddings` and `web_search_tool` from them.
+    """
+    import langchain_cohere
+    import langchain_community.tools.tavily_search
+    import langchain_groq
+
+    langchain_groq.ChatGroq = lambda **kwargs: FakeChatModel(latency=llm_latency)
+    langchain_cohere.CohereEmbeddings = lambda **kwargs: FakeEmbeddings(
+        embedding_latency
+    )
+    langchain_community.tools.tavily_search.TavilySearchResults = (
+        lambda **kwargs: FakeSearchTool(latency=search_latency)
+    )
+
+
+def seed_stores(chunks=200, forms=20):
+    """
+    Fill the full-context and form-struct-data collections of the working
+    directory with synthetic records. Existing records are left untouched.
+    """
+    from langchain_core.documents import Document
+
+    from ingest import upsert_chunks
+    from tools import embeddings, vectorstore
+    from utils import form_index, upsert_forms
+
+    batch = [
+        (
+            "bench",
+            f"bench:{i}",
+            Document(
+                page_content=f"Section {i} of the Copyright Act, 1957 covers "
+                f"performer rights, royalties and statutory licenses, part {i}.",
+                metadata={"source": "bench"},
+            ),
+        )
+        for i in range(chunks)
+    ]
+    upsert_chunks(vectorstore._collection, embeddings, batch)
+
+    def form(i):
+        data = {
+            "formId": f"bench-{i}",
+            "title": f"Copyright registration form {i}",
+            "description": f"Register a copyrighted work, variant {i}",
+            "fields": [{"label": "Name"}, {"label": "Email"}, {"label": "Title"}],
+        }
+        return {"data": {**data, "data": data}}
+
+    upsert_forms(form(i) for i in range(forms))
+    form_index.load()
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 1) if values else None
+
+
+async def run_load(call, questions, concurrency):
+    """
+    Send questions through call with at most `concurrency` in flight.
+
+    Returns:
+        dict: Request, error and throughput figures with latency percentiles
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(question):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(question)
+            except Exception as e:
+                errors += 1
+                logger.warning("bench request failed", extra={"error": str(e)})
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    calls_before = dict(fake_calls)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(question) for question in questions))
+    elapsed = time.perf_counter() - start
+    requests = len(questions)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        **{
+            f"{kind}_calls_per_request": round(
+                (fake_calls[kind] - calls_before[kind]) / requests, 2
+            )
+            for kind in fake_calls
+        },
+    }
+
+
+async def run_benchmarks(targets, scenarios, concurrencies, requests):
+    """
+    Benchmark every target, scenario and concurrency level.
+
+    Yields:
+        dict: One result per combination
+    """
+    import httpx
+
+    from graph import app, app_workflow, graph_config
+    from nodes import request_budget
+
+    async def call_graph(question):
+        state = {"question": question, "context": 0, **request_budget()}
+        await app_workflow.ainvoke(state, graph_config())
+
+    transport = httpx.ASGITransport(app=app)
+    client = httpx.AsyncClient(transport=transport, base_url="http://bench")
+    async with client:
+
+        async def call_api(question):
+            response = await client.post(
+                "/query", json={"question": question, "user_id": 0}
+            )
+            response.raise_for_status()
+
+        calls = {"graph": call_graph, "api": call_api}
+        for target in targets:
+            for scenario in scenarios:
+                # Untimed warm-up request
+                await calls[target](f"{SCENARIOS[scenario]} (warm-up)?")
+                for concurrency in concurrencies:
+                    questions = [
+                        f"{SCENARIOS[scenario]} ({target} #{i}, c={concurrency})?"
+                        for i in range(requests)
+                    ]
+                    result = await run_load(calls[target], questions, concurrency)
+                    yield {
+                        "target": target,
+                        "scenario": scenario,
+                        "concurrency": concurrency,
+                        **result,
+                    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the graph and the API offline against fake LLM, "
+        "embeddings and web search. Prints one JSON result per line."
+    )
+    parser.add_argument("--targets", default="graph,api")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument(
+        "--concurrency", default="1,8,32", help="Comma-separated levels"
+    )
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument(
+        "--llm-latency", default="0.3:0.1", help="MEAN[:STDDEV] in seconds"
+    )
+    parser.add_argument("--embedding-latency", default="0.05:0.01")
+    parser.add_argument("--search-latency", default="0.5:0.2")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workdir", help="Directory holding the bench vector store, temporary if unset"
+    )
+    parser.add_argument("--answer-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    # No disk embedding cache, so fake vectors never reach the real one
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    install_fakes(
+        Latency.parse(args.llm_latency, args.seed),
+        Latency.parse(args.embedding_latency, args.seed + 1),
+        Latency.parse(args.search_latency, args.seed + 2),
+    )
+    # The stores are opened relative to the working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    from logs import configure_logging
+
+    configure_logging()
+    seed_stores()
+
+    async def run():
+        async for result in run_benchmarks(
+            args.targets.split(","),
+            args.scenarios.split(","),
+            [int(c) for c in args.concurrency.split(",")],
+            args.requests,
+        ):
+            print(json.dumps(result), flush=True)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from tools import vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Grade retrieved documents locally from their BM25 score against the
+# question, only calling retrieval_grader when the score falls between the two
+# thresholds. Scores are normalized to 0-1 by the best score the question's
+# terms could reach; an average-length chunk containing each question term
+# once scores about 0.4.
+PREGRADE_ENABLED = os.environ.get("PREGRADE_ENABLED", "false").lower() == "true"
+PREGRADE_HIGH = float(os.environ.get("PREGRADE_HIGH", "0.35"))
+PREGRADE_LOW = float(os.environ.get("PREGRADE_LOW", "0.05"))
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its "
+    "me my of on or our that the their this to under was what when where which "
+    "who why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [
+        word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """
+    BM25 statistics of the full-context collection (document frequency of
+    every term, chunk count and average chunk length) used to pre-grade
+    retrieved chunks.
+
+    A chunk scoring at or above high is accepted and one at or below low is
+    rejected without an LLM call. In between grade returns None so the caller
+    asks retrieval_grader.
+    """
+
+    def __init__(self, vectorstore, high, low, k1=1.5, b=0.75):
+        self.vectorstore = vectorstore
+        self.high = high
+        self.low = low
+        self.k1 = k1
+        self.b = b
+
+        self._document_frequency = None
+        self._count = 0
+        self._average_length = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "uncertain": 0}
+
+    def load(self):
+        """
+        Tokenize every chunk of the collection and count its terms.
+        """
+        with self._lock:
+            self._load()
+
+    @property
+    def loaded(self):
+        return self._document_frequency is not None
+
+    def ensure_loaded(self):
+        """
+        Build the statistics unless they already are.
+        """
+        with self._lock:
+            if not self.loaded:
+                self._load()
+
+    def _load(self):
+        records = self.vectorstore.get(include=["documents"])
+        document_frequency = Counter()
+        total_length = 0
+        for text in records["documents"]:
+            terms = tokenize(text or "")
+            total_length += len(terms)
+            document_frequency.update(set(terms))
+        count = len(records["documents"])
+        self._document_frequency = document_frequency
+        self._count = count
+        self._average_length = total_length / count if count else 0.0
+        logger.info(
+            "bm25 index loaded",
+            extra={"chunks": count, "terms": len(document_frequency)},
+        )
+
+    def idf(self, term):
+        df = self._document_frequency.get(term, 0)
+        return math.log(1 + (self._count - df + 0.5) / (df + 0.5))
+
+    def score(self, question, text):
+        """
+        Args:
+            question (str): The user question
+            text (str): The chunk to score
+
+        Returns:
+            float: BM25 score of the chunk divided by the highest score the
+            question's terms can reach, between 0 and 1
+        """
+        if not self.loaded:
+            self.ensure_loaded()
+        query_terms = set(tokenize(question))
+        if not query_terms or not self._count:
+            return 0.0
+        terms = tokenize(text)
+        frequencies = Counter(terms)
+        length_norm = 1 - self.b + self.b * len(terms) / (self._average_length or 1)
+        score = best = 0.0
+        for term in query_terms:
+            idf = self.idf(term)
+            best += idf * (self.k1 + 1)
+            tf = frequencies.get(term, 0)
+            if tf:
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return min(score / best, 1.0) if best else 0.0
+
+    def grade(self, question, text):
+        """
+        Returns:
+            bool: True to accept, False to reject, None when the score is
+            ambiguous and the LLM grader should decide
+        """
+        score = self.score(question, text)
+        if score >= self.high:
+            self.stats["accepted"] += 1
+            return True
+        if score <= self.low:
+            self.stats["rejected"] += 1
+            return False
+        self.stats["uncertain"] += 1
+        return None
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Accepted, rejected and uncertain counts and the grader calls
+            avoided
+        """
+        return {
+            **self.stats,
+            "grader_calls_avoided": self.stats["accepted"] + self.stats["rejected"],
+        }
+
+
+bm25_index = BM25Index(vectorstore, high=PREGRADE_HIGH, low=PREGRADE_LOW)
@@ -0,0 +1,358 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """
+    Normalize a question for exact-match lookups: lowercase, collapse whitespace
+    and drop trailing punctuation.
+
+    Args:
+        question (str): The raw user question
+
+    Returns:
+        str: The normalized question
+    """
+    question = " ".join(question.lower().split())
+    return re.sub(r"[\s?.!]+$", "", question)
+
+
+def chroma_collection_version(vectorstore, page_size=10000):
+    """
+    Fingerprint of a Chroma collection, used to detect that it changed.
+
+    Only the collection itself is read, so writes to other collections in the
+    same persist directory don't change it. The full-context chunk IDs are
+    content hashes, so adding, removing or editing a chunk changes the digest.
+
+    Args:
+        vectorstore: The Chroma vectorstore to fingerprint
+        page_size: IDs read per query
+
+    Returns:
+        tuple: (record count, digest of the sorted record IDs)
+    """
+    if vectorstore is None:
+        return None
+    collection = vectorstore._collection
+    ids = []
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=len(ids))["ids"]
+        ids += page
+        if len(page) < page_size:
+            break
+    digest = hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+    return len(ids), digest
+
+
+class _Entry:
+    __slots__ = ("value", "embedding", "expires_at", "size")
+
+    def __init__(self, value, embedding, expires_at, size):
+        self.value = value
+        self.embedding = embedding
+        self.expires_at = expires_at
+        self.size = size
+
+
+class AnswerCache:
+    """
+    Two-layer response cache for the query endpoints.
+
+    The first layer is an exact match on the normalized question. The second
+    compares the question embedding against every cached question and returns
+    the closest entry if its cosine similarity reaches similarity_threshold.
+    Entries are evicted least recently used first once max_entries or
+    max_bytes is exceeded, and expire after ttl_seconds. The whole cache is
+    dropped when version_fn starts returning a different value. version_fn is
+    called at most every version_check_interval seconds, outside the cache
+    lock, and in a worker thread on the async path.
+
+    A similar question is not necessarily the same kind of request, so lookups
+    can pass confirm_similar to vet the question before a semantic hit is
+    served.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        max_entries=1024,
+        ttl_seconds=3600,
+        max_bytes=64 * 1024 * 1024,
+        similarity_threshold=0.95,
+        version_fn=None,
+        version_check_interval=30,
+    ):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.similarity_threshold = similarity_threshold
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._matrix_keys = []
+        self._version = None
+        self._version_checked_at = 0.0
+        self._stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "semantic_rejections": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def lookup(self, question, confirm_similar=None):
+        """
+        Look a question up in the cache.
+
+        Args:
+            question (str): The raw user question
+            confirm_similar: Optional callable taking the question, called on
+                a semantic hit only; the hit is served if it returns True
+
+        Returns:
+            tuple: (cached value or None, question embedding or None). Pass the
+            embedding back to put() on a miss so it is not computed twice.
+        """
+        self._check_version()
+        key = normalize_question(question)
+        value = self._get_exact(key)
+        if value is not None:
+            return value, None
+        embedding = self._unit(self.embeddings.embed_query(key))
+        value = self._get_similar(embedding)
+        if value is not None and confirm_similar and not confirm_similar(question):
+            self._reject_similar()
+            value = None
+        return value, embedding
+
+    async def alookup(self, question, confirm_similar=None):
+        """
+        Async version of lookup, confirm_similar is a coroutine function.
+        """
+        await self._acheck_version()
+        key = normalize_question(question)
+        value = self._get_exact(key)
+        if value is not None:
+            return value, None
+        embedding = self._unit(await self.embeddings.aembed_query(key))
+        value = self._get_similar(embedding)
+        if value is not None and confirm_similar:
+            if not await confirm_similar(question):
+                self._reject_similar()
+                value = None
+        return value, embedding
+
+    def put(self, question, value, embedding=None):
+        """
+        Store a value for a question.
+
+        Args:
+            question (str): The raw user question
+            value (dict): JSON-serializable value to cache
+            embedding: Embedding returned by lookup(), computed if missing
+        """
+        key = normalize_question(question)
+        if embedding is None:
+            embedding = self._unit(self.embeddings.embed_query(key))
+        size = len(key) + len(json.dumps(value)) + embedding.nbytes
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(
+                value, embedding, time.monotonic() + self.ttl_seconds, size
+            )
+            self._bytes += size
+            self._matrix = None
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self):
+        """
+        Drop every cached entry.
+        """
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters and current size of the cache
+        """
+        with self._lock:
+            lookups = (
+                self._stats["exact_hits"]
+                + self._stats["semantic_hits"]
+                + self._stats["misses"]
+            )
+            hits = lookups - self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _get_exact(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self._stats["exact_hits"] += 1
+            return entry.value
+
+    def _get_similar(self, embedding):
+        with self._lock:
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries)
+                    self._matrix = np.stack(
+                        [self._entries[k].embedding for k in self._matrix_keys]
+                    )
+                scores = self._matrix @ embedding
+                now = time.monotonic()
+                for i in np.argsort(-scores):
+                    if scores[i] < self.similarity_threshold:
+                        break
+                    key = self._matrix_keys[i]
+                    entry = self._entries[key]
+                    if entry.expires_at < now:
+                        continue
+                    self._entries.move_to_end(key)
+                    self._stats["semantic_hits"] += 1
+                    return entry.value
+            self._stats["misses"] += 1
+            return None
+
+    def _reject_similar(self):
+        with self._lock:
+            self._stats["semantic_hits"] -= 1
+            self._stats["semantic_rejections"] += 1
+            self._stats["misses"] += 1
+
+    def _check_version(self):
+        if not self._version_check_due():
+            return
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            logger.warning("answer cache version check failed", extra={"error": str(e)})
+            return
+        self._apply_version(version)
+
+    async def _acheck_version(self):
+        if not self._version_check_due():
+            return
+        try:
+            version = await asyncio.to_thread(self.version_fn)
+        except Exception as e:
+            logger.warning("answer cache version check failed", extra={"error": str(e)})
+            return
+        self._apply_version(version)
+
+    def _version_check_due(self):
+        """
+        Claim the next version check, so concurrent lookups don't all run one.
+        """
+        if self.version_fn is None:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._version_checked_at < self.version_check_interval:
+                return False
+            self._version_checked_at = now
+            return True
+
+    def _apply_version(self, version):
+        with self._lock:
+            if self._version is not None and version != self._version:
+                logger.info("vectorstore changed, invalidating answer cache")
+                self._clear()
+            self._version = version
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self._matrix = None
+
+    def _clear(self):
+        if self._entries:
+            self._stats["invalidations"] += 1
+        self._entries.clear()
+        self._bytes = 0
+        self._matrix = None
+        self._matrix_keys = []
+
+    @staticmethod
+    def _unit(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one execution.
+
+    The first caller for a key starts the execution and later callers await
+    the same result until it finishes. The execution is shielded, so a caller
+    giving up does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._stats = {"executions": 0, "saved_executions": 0, "inflight": 0}
+
+    async def run(self, key, make_coroutine):
+        """
+        Args:
+            key: Hashable identity of the call
+            make_coroutine: Zero-argument callable returning the coroutine to
+                run when no call with this key is in flight
+
+        Returns:
+            tuple: (result, True if it was shared from another caller's
+            execution)
+        """
+        future = self._inflight.get(key)
+        shared = future is not None
+        if shared:
+            self._stats["saved_executions"] += 1
+        else:
+            future = asyncio.ensure_future(make_coroutine())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._stats["executions"] += 1
+        return await asyncio.shield(future), shared
+
+    def stats(self):
+        """
+        Returns:
+            dict: Executions started, executions saved by coalescing, and
+            executions currently in flight
+        """
+        return {**self._stats, "inflight": len(self._inflight)}
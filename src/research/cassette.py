@@ -0,0 +1,383 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+
+logger = logging.getLogger(__name__)
+
+# "record" stores every LLM, embedding and web search call in the cassette,
+# "replay" answers them from it without touching the network, "off" does
+# neither. Replayed calls sleep for their recorded latency unless
+# CASSETTE_REPLAY_LATENCY is "none".
+#
+# A cache in front of a recorded client decides which calls reach the
+# cassette, and a replay starting with different cache contents would need
+# calls that were never recorded. The embedding, answer and web search caches
+# are therefore off while recording or replaying (see CACHES_ENABLED).
+#
+# Streamed generations are recorded whole. They replay as a single chunk, so
+# /query/stream sends the replayed generation as one token event.
+CASSETTE_MODE = os.environ.get("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.environ.get("CASSETTE_PATH", "cassette.sqlite3")
+CASSETTE_REPLAY_LATENCY = os.environ.get(
+    "CASSETTE_REPLAY_LATENCY", "recorded"
+).lower()
+
+
+class Cassette:
+    """
+    SQLite file of recorded calls keyed by a hash of the call's kind and input.
+
+    Embedding vectors are stored as float32 bytes, other responses as
+    zlib-compressed JSON, each with the latency of the original call.
+    """
+
+    def __init__(self, path, mode, replay_latency="recorded"):
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS calls "
+            "(key TEXT PRIMARY KEY, kind TEXT, response BLOB, latency REAL)"
+        )
+        self._db.commit()
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    @staticmethod
+    def key(kind, payload):
+        """
+        Args:
+            kind (str): "llm", "embedding" or "search"
+            payload: JSON-serializable input of the call
+
+        Returns:
+            str: Hex digest identifying the call
+        """
+        content = json.dumps([kind, payload], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def record(self, key, kind, response, latency):
+        if kind == "embedding":
+            blob = np.asarray(response, dtype=np.float32).tobytes()
+        else:
+            blob = zlib.compress(json.dumps(response).encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO calls (key, kind, response, latency) "
+                "VALUES (?, ?, ?, ?)",
+                (key, kind, blob, latency),
+            )
+            self._db.commit()
+            self._stats["recorded"] += 1
+
+    def replay(self, key):
+        """
+        Returns:
+            tuple: (recorded response, seconds to wait before returning it)
+
+        Raises:
+            KeyError: The call was never recorded
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT kind, response, latency FROM calls WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                logger.warning("call not in cassette", extra={"key": key[:12]})
+                raise KeyError(f"call {key[:12]} is not in cassette {self.path}")
+            self._stats["replayed"] += 1
+        kind, blob, latency = row
+        if kind == "embedding":
+            response = np.frombuffer(blob, dtype=np.float32).tolist()
+        else:
+            response = json.loads(zlib.decompress(blob))
+        return response, latency if self.replay_latency == "recorded" else 0.0
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counts of recorded, replayed and missing calls
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+cassette = (
+    Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_REPLAY_LATENCY)
+    if CASSETTE_MODE in ("record", "replay")
+    else None
+)
+CACHES_ENABLED = cassette is None
+
+
+def _message_payload(model, messages, stop):
+    return {
+        "model": model,
+        "messages": [[message.type, message.content] for message in messages],
+        "stop": stop,
+    }
+
+
+def _chat_result(response):
+    message = AIMessage(
+        content=response["content"], usage_metadata=response.get("usage_metadata")
+    )
+    return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _chat_chunk(response):
+    message = AIMessageChunk(
+        content=response["content"], usage_metadata=response.get("usage_metadata")
+    )
+    return ChatGenerationChunk(message=message)
+
+
+def _chat_response(result):
+    return _message_response(result.generations[0].message)
+
+
+def _message_response(message):
+    return {"content": message.content, "usage_metadata": message.usage_metadata}
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Chat model that records the calls of `underlying` into the cassette, or
+    replays them from it. `underlying` is None in replay mode.
+    """
+
+    underlying: Any
+    model: str
+    cassette: Any
+
+    @property
+    def _llm_type(self):
+        return "cassette"
+
+    def _key(self, messages, stop):
+        payload = _message_payload(self.model, messages, stop)
+        return self.cassette.key("llm", payload)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop)
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(key)
+            time.sleep(delay)
+            return _chat_result(response)
+        start = time.perf_counter()
+        result = self.underlying._generate(messages, stop=stop, **kwargs)
+        latency = time.perf_counter() - start
+        self.cassette.record(key, "llm", _chat_response(result), latency)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop)
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(key)
+            await asyncio.sleep(delay)
+            return _chat_result(response)
+        start = time.perf_counter()
+        result = await self.underlying._agenerate(messages, stop=stop, **kwargs)
+        latency = time.perf_counter() - start
+        self.cassette.record(key, "llm", _chat_response(result), latency)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop)
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(key)
+            time.sleep(delay)
+            yield _chat_chunk(response)
+            return
+        start = time.perf_counter()
+        merged = None
+        for chunk in self.underlying._stream(messages, stop=stop, **kwargs):
+            merged = chunk if merged is None else merged + chunk
+            yield chunk
+        if merged is not None:
+            latency = time.perf_counter() - start
+            self.cassette.record(key, "llm", _message_response(merged.message), latency)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop)
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(key)
+            await asyncio.sleep(delay)
+            yield _chat_chunk(response)
+            return
+        start = time.perf_counter()
+        merged = None
+        async for chunk in self.underlying._astream(messages, stop=stop, **kwargs):
+            merged = chunk if merged is None else merged + chunk
+            yield chunk
+        if merged is not None:
+            latency = time.perf_counter() - start
+            self.cassette.record(key, "llm", _message_response(merged.message), latency)
+
+
+class CassetteEmbeddings(Embeddings):
+    """
+    Embeddings that record the vectors of `underlying` into the cassette one
+    text at a time, or replay them from it. `underlying` is None in replay
+    mode.
+    """
+
+    def __init__(self, underlying, model, cassette):
+        self.underlying = underlying
+        self.model = model
+        self.cassette = cassette
+
+    def _keys(self, method, texts):
+        return [
+            self.cassette.key("embedding", [self.model, method, text])
+            for text in texts
+        ]
+
+    def _replay(self, keys):
+        replies = [self.cassette.replay(key) for key in keys]
+        delay = max((delay for _, delay in replies), default=0.0)
+        return [vector for vector, _ in replies], delay
+
+    def _record(self, keys, vectors, latency):
+        for key, vector in zip(keys, vectors):
+            self.cassette.record(key, "embedding", vector, latency)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = self._keys("documents", texts)
+        if self.cassette.mode == "replay":
+            vectors, delay = self._replay(keys)
+            time.sleep(delay)
+            return vectors
+        start = time.perf_counter()
+        vectors = self.underlying.embed_documents(texts)
+        return self._record(keys, vectors, time.perf_counter() - start)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = self._keys("documents", texts)
+        if self.cassette.mode == "replay":
+            vectors, delay = self._replay(keys)
+            await asyncio.sleep(delay)
+            return vectors
+        start = time.perf_counter()
+        vectors = await self.underlying.aembed_documents(texts)
+        return self._record(keys, vectors, time.perf_counter() - start)
+
+    def embed_query(self, text: str) -> List[float]:
+        keys = self._keys("query", [text])
+        if self.cassette.mode == "replay":
+            vectors, delay = self._replay(keys)
+            time.sleep(delay)
+            return vectors[0]
+        start = time.perf_counter()
+        vector = self.underlying.embed_query(text)
+        return self._record(keys, [vector], time.perf_counter() - start)[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys = self._keys("query", [text])
+        if self.cassette.mode == "replay":
+            vectors, delay = self._replay(keys)
+            await asyncio.sleep(delay)
+            return vectors[0]
+        start = time.perf_counter()
+        vector = await self.underlying.aembed_query(text)
+        return self._record(keys, [vector], time.perf_counter() - start)[0]
+
+
+class CassetteSearchTool(BaseTool):
+    """
+    Search tool that records the results of `underlying` into the cassette, or
+    replays them from it. `underlying` is None in replay mode.
+    """
+
+    name: str = "tavily_search_results_json"
+    description: str = "Web search, recorded or replayed from a cassette"
+    underlying: Any
+    cassette: Any
+
+    def _run(self, query: str, run_manager=None):
+        key = self.cassette.key("search", [self.name, query])
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(key)
+            time.sleep(delay)
+            return response
+        start = time.perf_counter()
+        results = self.underlying.invoke({"query": query})
+        self.cassette.record(key, "search", results, time.perf_counter() - start)
+        return results
+
+    async def _arun(self, query: str, run_manager=None):
+        key = self.cassette.key("search", [self.name, query])
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(key)
+            await asyncio.sleep(delay)
+            return response
+        start = time.perf_counter()
+        results = await self.underlying.ainvoke({"query": query})
+        self.cassette.record(key, "search", results, time.perf_counter() - start)
+        return results
+
+
+def with_cassette_llm(make_llm, model):
+    """
+    Args:
+        make_llm: Zero-argument factory of the real chat model
+        model (str): Model name, part of the recording key
+
+    Returns:
+        The chat model wrapped for recording or replay, or the real chat
+        model when the cassette is off. Replay never builds the real model,
+        so it runs without API keys.
+    """
+    if cassette is None:
+        return make_llm()
+    underlying = make_llm() if cassette.mode == "record" else None
+    return CassetteChatModel(underlying=underlying, model=model, cassette=cassette)
+
+
+def with_cassette_embeddings(make_embeddings, model):
+    """
+    Args:
+        make_embeddings: Zero-argument factory of the real embeddings
+        model (str): Model name, part of the recording key
+
+    Returns:
+        The embeddings wrapped for recording or replay, or the real embeddings
+        when the cassette is off
+    """
+    if cassette is None:
+        return make_embeddings()
+    underlying = make_embeddings() if cassette.mode == "record" else None
+    return CassetteEmbeddings(underlying, model, cassette)
+
+
+def with_cassette_search(make_tool):
+    """
+    Args:
+        make_tool: Zero-argument factory of the real search tool
+
+    Returns:
+        The search tool wrapped for recording or replay, or the real tool when
+        the cassette is off
+    """
+    if cassette is None:
+        return make_tool()
+    underlying = make_tool() if cassette.mode == "record" else None
+    return CassetteSearchTool(underlying=underlying, cassette=cassette)
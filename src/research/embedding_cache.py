@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import tracing
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(
+    os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", "20000")
+)
+# Most texts sent in one embed call, Cohere's embed endpoint takes up to 96
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "96"))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches vectors in an in-process LRU backed by a
+    SQLite file, keyed by a hash of model, input type and text.
+
+    Query and document embeddings are cached separately because Cohere embeds
+    them with different input types. The async methods read and write the
+    SQLite file in a worker thread so disk I/O never blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        underlying,
+        model,
+        db_path=EMBEDDING_CACHE_PATH,
+        max_memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES,
+        batch_size=EMBEDDING_BATCH_SIZE,
+    ):
+        self.underlying = underlying
+        self.model = model
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.batch_size = batch_size
+
+        self._memory = OrderedDict()
+        # Guards the memory tier and the counters
+        self._lock = threading.Lock()
+        # Serializes use of the SQLite connection, held without _lock so
+        # memory hits don't wait on disk I/O
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "api_calls": 0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", t) for t in texts]
+        found, missing = self._lookup(keys, texts)
+        for batch in self._batches(missing):
+            self._count("api_calls")
+            start = time.perf_counter()
+            vectors = self.underlying.embed_documents(list(batch.values()))
+            tracing.record("embedding", "embed_documents", start, time.perf_counter())
+            self._store(dict(zip(batch, vectors)), found)
+        return [found[k] for k in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", t) for t in texts]
+        found, missing = await self._alookup(keys, texts)
+        for batch in self._batches(missing):
+            self._count("api_calls")
+            start = time.perf_counter()
+            vectors = await self.underlying.aembed_documents(list(batch.values()))
+            tracing.record("embedding", "embed_documents", start, time.perf_counter())
+            await self._astore(dict(zip(batch, vectors)), found)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        found, missing = self._lookup([key], [text])
+        if missing:
+            self._count("api_calls")
+            start = time.perf_counter()
+            vector = self.underlying.embed_query(text)
+            tracing.record("embedding", "embed_query", start, time.perf_counter())
+            self._store({key: vector}, found)
+        return found[key]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        found, missing = await self._alookup([key], [text])
+        if missing:
+            self._count("api_calls")
+            start = time.perf_counter()
+            vector = await self.underlying.aembed_query(text)
+            tracing.record("embedding", "embed_query", start, time.perf_counter())
+            await self._astore({key: vector}, found)
+        return found[key]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries, with the ones not cached yet sent batch_size at a
+        time when the underlying client takes several queries per call. Used to
+        warm the cache for a batch of questions before they run.
+        """
+        keys = [self._key("query", t) for t in texts]
+        found, missing = await self._alookup(keys, texts)
+        for batch in self._batches(missing):
+            self._count("api_calls")
+            start = time.perf_counter()
+            pending = list(batch.values())
+            if hasattr(self.underlying, "aembed"):
+                # Cohere embeds queries with a separate input type
+                vectors = await self.underlying.aembed(
+                    pending, input_type="search_query"
+                )
+            else:
+                vectors = await asyncio.gather(
+                    *(self.underlying.aembed_query(t) for t in pending)
+                )
+            tracing.record("embedding", "embed_queries", start, time.perf_counter())
+            await self._astore(dict(zip(batch, vectors)), found)
+        return [found[k] for k in keys]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Memory/disk hit and miss counters plus the overall hit rate
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def _batches(self, missing):
+        """
+        Split the texts to embed into dicts of at most batch_size, by key.
+        """
+        items = list(missing.items())
+        for i in range(0, len(items), self.batch_size):
+            yield dict(items[i : i + self.batch_size])
+
+    def _key(self, input_type, text):
+        return hashlib.sha256(
+            f"{self.model}\0{input_type}\0{text}".encode("utf-8")
+        ).hexdigest()
+
+    def _lookup(self, keys, texts):
+        """
+        Resolve keys from memory, then disk.
+
+        Returns:
+            tuple: (found vectors by key, texts still to embed by key with
+            duplicates removed)
+        """
+        found, missing = self._lookup_memory(keys, texts)
+        rows = self._read(list(missing)) if missing else []
+        self._resolve(rows, found, missing)
+        return found, missing
+
+    async def _alookup(self, keys, texts):
+        """
+        Async version of _lookup, reading the disk tier in a worker thread.
+        """
+        found, missing = self._lookup_memory(keys, texts)
+        rows = []
+        if missing and self._db is not None:
+            rows = await asyncio.to_thread(self._read, list(missing))
+        self._resolve(rows, found, missing)
+        return found, missing
+
+    def _lookup_memory(self, keys, texts):
+        found = {}
+        missing = OrderedDict()
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    found[key] = vector
+                else:
+                    missing[key] = text
+        return found, missing
+
+    def _read(self, keys):
+        if self._db is None:
+            return []
+        rows = []
+        with self._db_lock:
+            # Stay under SQLite's default bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows += self._db.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                ).fetchall()
+        return rows
+
+    def _resolve(self, rows, found, missing):
+        """
+        Move the vectors read from disk from missing to found.
+        """
+        with self._lock:
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                self._remember(key, vector)
+                self._stats["disk_hits"] += 1
+                found[key] = vector
+                del missing[key]
+            self._stats["misses"] += len(missing)
+
+    def _store(self, vectors, found):
+        self._remember_all(vectors, found)
+        self._write(vectors)
+
+    async def _astore(self, vectors, found):
+        """
+        Async version of _store, writing to disk in a worker thread.
+        """
+        self._remember_all(vectors, found)
+        if self._db is not None:
+            await asyncio.to_thread(self._write, vectors)
+
+    def _remember_all(self, vectors, found):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+                found[key] = vector
+
+    def _write(self, vectors):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in vectors.items()
+                ],
+            )
+            self._db.commit()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
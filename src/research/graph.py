@@ -1,11 +1,41 @@
-from fastapi import FastAPI, HTTPException, Body
+import asyncio
+import copy
+import json
+import logging
+import os
+import time
+
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Body, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Any, Optional
 from pydantic_core import core_schema
 import uvicorn
-from langgraph.graph import END, StateGraph
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, StateGraph
 from state import GraphState
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from cache import (
+    AnswerCache,
+    SingleFlight,
+    chroma_collection_version,
+    normalize_question,
+)
+from cassette import CACHES_ENABLED, cassette
+from logs import configure_logging
+from metrics import metrics_callback, registry, track_edge, track_node
+from profile_client import profile_client
+import tracing
+from tracing import end_trace, start_trace
+from resources import resources
+from tools import embeddings, intent_classifier
+from bm25 import PREGRADE_ENABLED, bm25_index
+from router import LOCAL_ROUTER_ENABLED, local_router
+from utils import form_index
+from websearch import web_search_cache
 
 # Import directly from the same file
 from nodes import (
@@ -16,29 +46,92 @@ from nodes import (
     grade_generation_v_documents_and_question,
     merge_node,
     retrieve,
+    classify_intent,
     route_intent,
     route_question,
     user_data_sql,
     web_search,
     entry_data,
+    adecide_to_generate,
+    agenerate,
+    aget_form_struct,
+    agrade_documents,
+    agrade_generation_v_documents_and_question,
+    amerge_node,
+    aretrieve,
+    aclassify_intent,
+    aroute_intent,
+    aroute_question,
+    auser_data_sql,
+    aweb_search,
+    aentry_data,
+    speculation_stats,
+    request_budget,
+    GENERATE_RESERVE_SECONDS,
+    MAX_GENERATIONS,
+    REQUEST_BUDGET_SECONDS,
 )
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+def node(name, func, afunc):
+    """
+    Pair a sync node with its async version and record its latency and errors.
+    invoke() runs func, ainvoke()/astream() await afunc on the event loop.
+    """
+    func, afunc = track_node(name, func, afunc)
+    return without_deps(RunnableLambda(func, afunc=afunc, name=func.__name__))
+
+
+def edge(name, func, afunc=None):
+    """
+    Like node(), for conditional edges: counts the branch taken.
+    """
+    func, afunc = track_edge(name, func, afunc)
+    return without_deps(RunnableLambda(func, afunc=afunc, name=func.__name__))
+
+
+def without_deps(runnable):
+    """
+    Tell LangGraph a node calls no subgraphs. To find them, compile() reads
+    every global attribute the node function uses, which would create lazy
+    resources such as the retriever at import time.
+    """
+    runnable.__dict__["deps"] = []
+    return runnable
 
 
 # Initialize the workflow
 workflow = StateGraph(GraphState)
 # Define the nodes
-workflow.add_node("websearch", web_search)  # web search
-workflow.add_node("retrieve", retrieve)  # retrieve
-workflow.add_node("grade_documents", grade_documents)  # grade documents
-workflow.add_node("generate", generate)
-workflow.add_node("entry_data", entry_data)
-workflow.add_node("user_data_sql", user_data_sql)
-workflow.add_node("get_form_struct", get_form_struct)
-workflow.add_node("merge_node", merge_node)
-workflow.add_node("route_intent", route_intent)
-workflow.set_conditional_entry_point(
-    route_question,
+workflow.add_node("websearch", node("websearch", web_search, aweb_search))  # web search
+workflow.add_node("retrieve", node("retrieve", retrieve, aretrieve))  # retrieve
+workflow.add_node(
+    "grade_documents", node("grade_documents", grade_documents, agrade_documents)
+)  # grade documents
+workflow.add_node("generate", node("generate", generate, agenerate))
+workflow.add_node("entry_data", node("entry_data", entry_data, aentry_data))
+workflow.add_node("user_data_sql", node("user_data_sql", user_data_sql, auser_data_sql))
+workflow.add_node(
+    "get_form_struct", node("get_form_struct", get_form_struct, aget_form_struct)
+)
+workflow.add_node("merge_node", node("merge_node", merge_node, amerge_node))
+workflow.add_node("route_intent", node("route_intent", route_intent, aroute_intent))
+workflow.add_node(
+    "route_question", node("route_question", route_question, aroute_question)
+)
+workflow.add_node(
+    "classify_intent", node("classify_intent", classify_intent, aclassify_intent)
+)
+# Routing and intent classification both only need the question, run them together
+workflow.add_edge(START, "route_question")
+workflow.add_edge(START, "classify_intent")
+workflow.add_edge("classify_intent", END)
+workflow.add_conditional_edges(
+    "route_question",
+    edge("route_question", lambda x: x["datasource"]),
     {
         "websearch": "websearch",
         "vectorstore": "retrieve",
@@ -47,7 +140,7 @@ workflow.set_conditional_entry_point(
 workflow.add_edge("retrieve", "grade_documents")
 workflow.add_conditional_edges(
     "grade_documents",
-    decide_to_generate,
+    edge("decide_to_generate", decide_to_generate, adecide_to_generate),
     {
         "websearch": "websearch",
         "generate": "generate",
@@ -56,16 +149,21 @@ workflow.add_conditional_edges(
 workflow.add_edge("websearch", "generate")
 workflow.add_conditional_edges(
     "generate",
-    grade_generation_v_documents_and_question,
+    edge(
+        "grade_generation_v_documents_and_question",
+        grade_generation_v_documents_and_question,
+        agrade_generation_v_documents_and_question,
+    ),
     {
         "not supported": "generate",
         "useful": "route_intent",
+        "unverified": "route_intent",
         "not useful": "websearch",
     },
 )
 workflow.add_conditional_edges(
     "route_intent",
-    lambda x: x["intent"],
+    edge("route_intent", lambda x: x["intent"]),
     {"question_answering": END, "command": "entry_data"},
 )
 workflow.add_edge("entry_data", "user_data_sql")
@@ -74,6 +172,25 @@ workflow.add_edge("user_data_sql", "merge_node")
 workflow.add_edge("get_form_struct", "merge_node")
 workflow.add_edge("merge_node", END)
 app_workflow = workflow.compile()
+# The generate loop is bounded by MAX_GENERATIONS, each round costs at most a
+# websearch and a generate step on top of the 7 fixed steps, plus one spare
+RECURSION_LIMIT = 8 + 2 * MAX_GENERATIONS
+# Hard bound on a whole run. The nodes wind down GENERATE_RESERVE_SECONDS
+# before the deadline; the margin past it lets the final generation and calls
+# still in flight finish before the run is cut off.
+REQUEST_TIMEOUT_MARGIN_SECONDS = max(
+    float(os.environ.get("REQUEST_TIMEOUT_MARGIN_SECONDS", "10")),
+    GENERATE_RESERVE_SECONDS,
+)
+REQUEST_TIMEOUT_SECONDS = REQUEST_BUDGET_SECONDS + REQUEST_TIMEOUT_MARGIN_SECONDS
+
+
+def graph_config():
+    """
+    Config of a graph run. The chains, retriever and tool inherit the metrics
+    callback from it, next to the callbacks of astream_events and tracers.
+    """
+    return {"recursion_limit": RECURSION_LIMIT, "callbacks": [metrics_callback]}
 
 
 # Create FastAPI app
@@ -93,20 +210,396 @@ app.add_middleware(
 )
 
 
+# Response cache shared by /query and /plain
+ANSWER_CACHE_ENABLED = (
+    os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    and CACHES_ENABLED
+)
+answer_cache = AnswerCache(
+    embeddings,
+    max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL", "3600")),
+    max_bytes=int(os.environ.get("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    similarity_threshold=float(
+        os.environ.get("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95")
+    ),
+    version_fn=lambda: chroma_collection_version(resources.get("vectorstore")),
+)
+
+# Concurrent identical questions share one graph execution
+SINGLE_FLIGHT_ENABLED = (
+    os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+)
+single_flight = SingleFlight()
+
+
+async def is_question_answering(question):
+    """
+    Whether the intent classifier takes the question for question answering.
+    Vets semantic answer cache hits: a command phrased like a cached question
+    must still reach the command steps.
+    """
+    try:
+        classification = await intent_classifier.ainvoke(
+            {"question": question}, {"callbacks": [metrics_callback]}
+        )
+    except Exception as e:
+        logger.warning("intent check failed", extra={"error": str(e)})
+        return False
+    return classification.get("intent") == "question_answering"
+
+
+async def run_workflow(question, user_id):
+    """
+    Run a question through the workflow, serving repeated questions from the
+    answer cache.
+
+    Command results carry a user-specific form_struct, so only question
+    answering results are cached.
+
+    Concurrent calls with the same normalized question share one graph
+    execution. Callers that joined a command execution take only its
+    user-independent part and re-run the user-specific steps with their own
+    user_id. The trace of a caller that joined records how long it waited,
+    and is annotated as coalesced with the trace id of the execution's
+    caller, if that one was traced.
+
+    Args:
+        question (str): The user's question or command
+        user_id (int): The unique identifier for the user
+
+    Returns:
+        dict: The final workflow state, or the cached subset of it
+    """
+    started = time.monotonic()
+    embedding = None
+    if ANSWER_CACHE_ENABLED:
+        cached, embedding = await answer_cache.alookup(
+            question, confirm_similar=is_question_answering
+        )
+        if cached is not None:
+            return cached
+
+    async def execute():
+        # Initialize the state with the question, user_id and latency budget
+        initial_state = {"question": question, "context": user_id, **request_budget()}
+
+        # Execute the workflow
+        result = await run_graph(initial_state)
+
+        cache_result(question, result, embedding)
+        return result, tracing.current_trace_id()
+
+    if not SINGLE_FLIGHT_ENABLED:
+        result, _ = await execute()
+        return result
+    wait_start = time.perf_counter()
+    (result, leader_trace_id), shared = await single_flight.run(
+        normalize_question(question), execute
+    )
+    if shared:
+        tracing.record("single_flight", "wait", wait_start, time.perf_counter())
+        tracing.annotate("coalesced", True)
+        tracing.annotate("leader_trace_id", leader_trace_id)
+    # Only the command steps read the user, everything before them depends on
+    # the question alone
+    if shared and result.get("intent") == "command":
+        time_left = REQUEST_TIMEOUT_SECONDS - (time.monotonic() - started)
+        result = await run_user_steps(result, user_id, time_left)
+    return result
+
+
+async def run_graph(initial_state):
+    """
+    Run the graph under REQUEST_TIMEOUT_SECONDS. Should the timeout hit, the
+    latest state is returned if it has a generation, flagged as unverified.
+
+    Args:
+        initial_state (dict): Question, user and budget fields
+
+    Returns:
+        dict: The final workflow state
+
+    Raises:
+        asyncio.TimeoutError: The timeout hit before any generation
+    """
+    latest = {}
+
+    async def run():
+        nonlocal latest
+        async for state in app_workflow.astream(
+            initial_state, graph_config(), stream_mode="values"
+        ):
+            latest = state
+        return latest
+
+    try:
+        return await asyncio.wait_for(run(), REQUEST_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        if not latest.get("generation"):
+            raise
+        logger.warning(
+            "workflow timed out, returning the latest generation",
+            extra={"timeout_seconds": REQUEST_TIMEOUT_SECONDS},
+        )
+        return {**latest, "unverified": True}
+
+
+def timeout_error():
+    return HTTPException(
+        status_code=504,
+        detail=f"Workflow timed out after {REQUEST_TIMEOUT_SECONDS:g} seconds "
+        "without a generation",
+    )
+
+
+# State filled in by the command steps for one user, not shared across callers
+USER_FIELDS = ("context", "user_data", "form_struct")
+
+# The user-specific command steps, timed like graph nodes when
+# run_user_steps runs them outside the graph
+_, atimed_get_form_struct = track_node(
+    "get_form_struct", get_form_struct, aget_form_struct
+)
+_, atimed_user_data_sql = track_node("user_data_sql", user_data_sql, auser_data_sql)
+_, atimed_merge_node = track_node("merge_node", merge_node, amerge_node)
+
+
+async def run_user_steps(result, user_id, timeout):
+    """
+    Re-run the user-specific command steps of a shared workflow result for
+    another user: look the form up, fetch their data and merge the two.
+
+    Only the user-independent part of the result is kept, deep-copied so
+    callers sharing an execution never see each other's state. Past timeout
+    seconds the generation is returned without a form, flagged unverified.
+    """
+    state = copy.deepcopy({k: v for k, v in result.items() if k not in USER_FIELDS})
+    state["context"] = user_id
+    try:
+        async with asyncio.timeout(max(timeout, 0)):
+            for update in await asyncio.gather(
+                atimed_get_form_struct(state), atimed_user_data_sql(state)
+            ):
+                state.update(update)
+            state.update(await atimed_merge_node(state))
+    except TimeoutError:
+        logger.warning("user steps timed out", extra={"user_id": user_id})
+        state = {k: v for k, v in state.items() if k not in USER_FIELDS}
+        return {**state, "context": user_id, "unverified": True}
+    return state
+
+
+def cache_result(question, result, embedding=None):
+    """
+    Store a question answering result in the answer cache.
+    """
+    cacheable = (
+        result.get("generation")
+        and result.get("intent") != "command"
+        and "form_struct" not in result
+        and not result.get("unverified")
+    )
+    if ANSWER_CACHE_ENABLED and cacheable:
+        answer_cache.put(question, {"generation": result["generation"]}, embedding)
+
+
+GRAPH_NODES = set(workflow.nodes)
+
+
+def sse_event(event, data):
+    """
+    Format a Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_workflow(question, user_id):
+    """
+    Run a question through the workflow and yield its progress as Server-Sent
+    Events:
+
+    - node: a graph node started or finished
+    - token: a chunk of the rag_chain generation
+    - retracted: the generation streamed so far was rejected by the graders
+      and will be regenerated; the reason is "not supported" or "not useful"
+    - end: the final response, same fields as WorkflowResponse
+    - error: the workflow failed
+
+    Args:
+        question (str): The user's question or command
+        user_id (int): The unique identifier for the user
+
+    Yields:
+        str: Formatted SSE events
+    """
+    embedding = None
+    if ANSWER_CACHE_ENABLED:
+        cached, embedding = await answer_cache.alookup(
+            question, confirm_similar=is_question_answering
+        )
+        if cached is not None:
+            yield sse_event("token", {"content": cached["generation"]})
+            yield sse_event(
+                "end",
+                {
+                    "generation": cached["generation"],
+                    "form_struct": None,
+                    "user_id": user_id,
+                },
+            )
+            return
+
+    initial_state = {"question": question, "context": user_id, **request_budget()}
+    result = {}
+    try:
+        async for event in app_workflow.astream_events(
+            initial_state, graph_config(), version="v2"
+        ):
+            kind = event["event"]
+            name = event["name"]
+            if kind == "on_chat_model_stream" and "rag_chain" in event["tags"]:
+                content = event["data"]["chunk"].content
+                if content:
+                    yield sse_event("token", {"content": content})
+            elif kind in ("on_chain_start", "on_chain_end") and name in GRAPH_NODES:
+                # Node runs are direct children of the graph run
+                if len(event["parent_ids"]) == 1:
+                    status = "start" if kind == "on_chain_start" else "end"
+                    yield sse_event("node", {"node": name, "status": status})
+            elif (
+                kind == "on_chain_end"
+                and name == "grade_generation_v_documents_and_question"
+            ):
+                decision = event["data"]["output"]
+                if decision not in ("useful", "unverified"):
+                    yield sse_event("retracted", {"reason": decision})
+            elif kind == "on_chain_end" and not event["parent_ids"]:
+                result = event["data"]["output"]
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Workflow execution failed: {str(e)}"})
+        return
+
+    cache_result(question, result, embedding)
+    yield sse_event(
+        "end",
+        {
+            "generation": result.get("generation"),
+            "form_struct": result.get("form_struct"),
+            "user_id": result.get("user_id", user_id),
+            "unverified": result.get("unverified", False),
+        },
+    )
+
+
+# Create the clients, store and chains and load the indexes when the server
+# starts instead of on the first request. Off by default so the server is up
+# as soon as it is imported; POST /warmup does the same on demand.
+PRELOAD_RESOURCES = os.environ.get("PRELOAD_RESOURCES", "false").lower() == "true"
+
+
+def load_indexes():
+    """Load the form catalog, router exemplars and BM25 statistics so requests
+    don't pay for it"""
+    indexes = [form_index]
+    if LOCAL_ROUTER_ENABLED:
+        indexes.append(local_router)
+    if PREGRADE_ENABLED:
+        indexes.append(bm25_index)
+    errors = {}
+    for index in indexes:
+        start = time.perf_counter()
+        try:
+            index.load()
+        except Exception as e:
+            logger.error(
+                "error loading index",
+                extra={"index": type(index).__name__, "error": str(e)},
+            )
+            errors[type(index).__name__] = str(e)
+        resources.timings[type(index).__name__] = round(
+            (time.perf_counter() - start) * 1000, 1
+        )
+    return errors
+
+
+def warmup():
+    """
+    Create every registered resource and load the indexes.
+
+    Returns:
+        dict: Total and per-resource time in milliseconds, and errors by name
+    """
+    start = time.perf_counter()
+    errors = resources.warmup()
+    errors.update(load_indexes())
+    total_ms = round((time.perf_counter() - start) * 1000, 1)
+    logger.info("warmup finished", extra={"duration_ms": total_ms, "errors": errors})
+    return {"total_ms": total_ms, "timings": dict(resources.timings), "errors": errors}
+
+
+@app.on_event("startup")
+def preload():
+    if PRELOAD_RESOURCES:
+        warmup()
+
+
+@app.post("/warmup")
+def warmup_endpoint():
+    """Create the clients, store, chains and indexes now if they aren't yet, and
+    return how long each took"""
+
+    return warmup()
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    """Close the pooled connections to the backend"""
+    await profile_client.aclose()
+
+
 class QueryRequest(BaseModel):
     question: str
     user_id: int
     context: Optional[Dict[str, Any]] = None
+    # Time the request and return the breakdown in a Server-Timing header
+    trace: bool = False
+    # Like trace, and also return the full timeline in the response body
+    debug: bool = False
 
 
 class WorkflowResponse(BaseModel):
     generation: Optional[str] = None
     form_struct: Optional[Dict[str, Any]] = None
     user_id: Optional[int] = None
+    # True when the latency or retry budget ran out before the graders passed
+    unverified: bool = False
+    # Request timeline, only set for debug requests
+    trace: Optional[Dict[str, Any]] = None
+
+
+def workflow_response(result, user_id):
+    """
+    Build the API response from the final workflow state.
+    """
+    # Parse the output for the response
+    response = WorkflowResponse()
+
+    # Add available fields from the result to the response
+    if "generation" in result:
+        response.generation = result["generation"]
+    if "form_struct" in result:
+        response.form_struct = result["form_struct"]
+    if "user_id" in result:
+        response.user_id = result["user_id"]
+    else:
+        response.user_id = user_id
+    response.unverified = bool(result.get("unverified"))
+    return response
 
 
 @app.post("/query", response_model=WorkflowResponse)
-async def execute_query(request: QueryRequest = Body(...)):
+async def execute_query(http_response: Response, request: QueryRequest = Body(...)):
     """
     Execute a query through the LangGraph workflow.
 
@@ -122,33 +615,32 @@ async def execute_query(request: QueryRequest = Body(...)):
 
     Optional parameters:
     - context: Additional context information
+    - trace: Return per-node and per-call timings in a Server-Timing header
+    - debug: Also return the request timeline in the `trace` field
     """
+    trace = token = None
+    if request.trace or request.debug:
+        trace, token = start_trace()
     try:
-        # Initialize the state with the question and user_id
-        initial_state = {"question": request.question, "context": request.user_id}
+        result = await run_workflow(request.question, request.user_id)
+        response = workflow_response(result, request.user_id)
 
-        # Execute the workflow
-        result = await app_workflow.ainvoke(initial_state, {"recursion_limit": 10})
-
-        # Parse the output for the response
-        response = WorkflowResponse()
-
-        # Add available fields from the result to the response
-        if "generation" in result:
-            response.generation = result["generation"]
-        if "form_struct" in result:
-            response.form_struct = result["form_struct"]
-        if "user_id" in result:
-            response.user_id = result["user_id"]
-        else:
-            response.user_id = request.user_id
+        if trace is not None:
+            http_response.headers["Server-Timing"] = trace.server_timing()
+            if request.debug:
+                response.trace = trace.to_dict()
 
         return response
 
+    except asyncio.TimeoutError:
+        raise timeout_error()
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Workflow execution failed: {str(e)}"
         )
+    finally:
+        if token is not None:
+            end_trace(token)
 
 
 @app.post("/plain")
@@ -167,11 +659,7 @@ async def plain_response(request: QueryRequest = Body(...)):
     - context: Additional context information
     """
     try:
-        # Initialize the state with the question and user_id
-        initial_state = {"question": request.question, "context": request.user_id}
-
-        # Execute the workflow
-        result = await app_workflow.ainvoke(initial_state, {"recursion_limit": 10})
+        result = await run_workflow(request.question, request.user_id)
 
         # Return just the generated text
         if "generation" in result and result["generation"]:
@@ -179,11 +667,193 @@ async def plain_response(request: QueryRequest = Body(...)):
         else:
             return "No response was generated for your query."
 
+    except asyncio.TimeoutError:
+        raise timeout_error()
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Workflow execution failed: {str(e)}"
         )
 
+@app.post("/query/stream")
+async def stream_query(request: QueryRequest = Body(...)):
+    """
+    Execute a query and stream its progress as Server-Sent Events.
+
+    Generation tokens are sent as they are produced, before the hallucination
+    and answer graders run. If a grader rejects the generation a "retracted"
+    event is sent and the regenerated answer streams after it. The last event
+    is "end" with the final response, or "error".
+
+    Required parameters:
+    - question: The user's question or command
+    - user_id: The unique identifier for the user
+    """
+    return StreamingResponse(
+        stream_workflow(request.question, request.user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Questions of a /query/batch request running through the graph at once
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+
+async def batch_workflow(requests):
+    """
+    Run a batch of queries with at most BATCH_CONCURRENCY in flight and yield
+    one NDJSON line per query as it completes, then a summary line.
+
+    The question embeddings used by the answer cache, the local router and
+    the retriever are computed for the whole batch up front, so the queries
+    find them cached instead of each making its own embedding call.
+
+    Args:
+        requests (list): QueryRequest objects
+
+    Yields:
+        str: {"index", ...WorkflowResponse fields} or {"index", "error"} per
+        query, in completion order, then {"summary": {...}}
+    """
+    start = time.perf_counter()
+    texts = [request.question for request in requests]
+    if ANSWER_CACHE_ENABLED:
+        texts += [normalize_question(request.question) for request in requests]
+    try:
+        await embeddings.aembed_queries(list(dict.fromkeys(texts)))
+    except Exception as e:
+        # Each query still embeds its own question
+        logger.warning("batch embedding failed", extra={"error": str(e)})
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_one(index, request):
+        async with semaphore:
+            try:
+                result = await run_workflow(request.question, request.user_id)
+            except asyncio.TimeoutError:
+                logger.warning("batch query timed out", extra={"index": index})
+                return {"index": index, "error": timeout_error().detail}
+            except Exception as e:
+                logger.warning(
+                    "batch query failed", extra={"index": index, "error": str(e)}
+                )
+                return {"index": index, "error": str(e) or type(e).__name__}
+            response = workflow_response(result, request.user_id)
+            return {"index": index, **response.model_dump(exclude={"trace"})}
+
+    tasks = [
+        asyncio.create_task(run_one(index, request))
+        for index, request in enumerate(requests)
+    ]
+    failed = 0
+    try:
+        for task in asyncio.as_completed(tasks):
+            item = await task
+            failed += "error" in item
+            yield json.dumps(item) + "\n"
+    finally:
+        # The client went away, stop the queries still waiting or running
+        for task in tasks:
+            task.cancel()
+
+    seconds = time.perf_counter() - start
+    summary = {
+        "total": len(requests),
+        "succeeded": len(requests) - failed,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "queries_per_second": round(len(requests) / seconds, 2) if seconds else None,
+    }
+    yield json.dumps({"summary": summary}) + "\n"
+
+
+@app.post("/query/batch")
+async def batch_query(requests: List[QueryRequest] = Body(...)):
+    """
+    Execute a list of queries and stream the results as NDJSON.
+
+    Each line is the result of one query, tagged with its position in the
+    request, in the order the queries finish. A failed query yields a line
+    with an "error" instead of failing the batch. The last line is a summary
+    with the success and failure counts and the throughput.
+    """
+    return StreamingResponse(
+        batch_workflow(requests), media_type="application/x-ndjson"
+    )
+
+
+registry.register_stats("answer_cache", "Answer cache counter", answer_cache.stats)
+registry.register_stats(
+    "embedding_cache", "Embedding cache counter", lambda: embeddings.stats()
+)
+registry.register_stats(
+    "resources", "Shared resource count and creation time", resources.stats
+)
+registry.register_stats(
+    "speculation", "Speculative prefetch counter", lambda: speculation_stats
+)
+registry.register_stats(
+    "local_router", "Local router decision count", lambda: local_router.stats
+)
+registry.register_stats(
+    "profile_client", "User profile client counter", profile_client.stats
+)
+registry.register_stats(
+    "web_search_cache", "Web search cache counter", web_search_cache.stats
+)
+registry.register_stats(
+    "pregrade", "BM25 pre-grade document count", bm25_index.get_stats
+)
+registry.register_stats(
+    "single_flight", "Coalesced graph execution count", single_flight.stats
+)
+if cassette is not None:
+    registry.register_stats("cassette", "Cassette call count", cassette.stats)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-node and per-chain latency, calls, tokens, errors"""
+
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Answer and embedding cache hit/miss counters"""
+
+    return {
+        "answers": answer_cache.stats(),
+        "embeddings": embeddings.stats(),
+        "single_flight": single_flight.stats(),
+        "web_search": web_search_cache.stats(),
+    }
+
+
+@app.get("/speculation/stats")
+async def speculation_stats_endpoint():
+    """Speculative prefetch counters: fetches started vs. used by the router's pick"""
+
+    return speculation_stats
+
+
+@app.get("/router/stats")
+async def router_stats():
+    """Local router decisions vs. fallbacks to the LLM router"""
+
+    return local_router.stats
+
+
+@app.get("/pregrade/stats")
+async def pregrade_stats():
+    """Documents settled by the BM25 pre-grade vs. sent to retrieval_grader"""
+
+    return bm25_index.get_stats()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -203,6 +873,11 @@ def custom_user_data_sql(state):
     return {"user_data": user_data, "user_id": user_id}
 
 
+logger.info(
+    "app imported",
+    extra={"duration_ms": round((time.perf_counter() - _import_started) * 1000, 1)},
+)
+
 if __name__ == "__main__":
 
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,413 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+import requests
+from bs4 import BeautifulSoup
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from logs import configure_logging
+from tools import embeddings, load_vectorstore_from_disk
+from utils import upsert_forms
+
+logger = logging.getLogger(__name__)
+
+
+def iter_forms(source):
+    """
+    Stream form JSON objects from a directory, a JSON/JSONL file or stdin.
+
+    Directories are walked for *.json and *.jsonl files. A .json file may hold a
+    single form or a list of forms, a .jsonl file holds one form per line.
+
+    Args:
+        source: Path to a directory or file, or "-" for JSONL on stdin
+
+    Yields:
+        dict: JSON form data
+    """
+    if source == "-":
+        yield from _iter_jsonl(sys.stdin)
+    elif os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.endswith((".json", ".jsonl")):
+                    yield from iter_forms(os.path.join(root, name))
+    elif source.endswith(".jsonl"):
+        with open(source, "r") as file:
+            yield from _iter_jsonl(file)
+    else:
+        with open(source, "r") as file:
+            data = json.load(file)
+        yield from data if isinstance(data, list) else [data]
+
+
+def _iter_jsonl(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def ingest_forms(source, batch_size=256):
+    """
+    Bulk-load forms into the form-struct-data collection.
+
+    Forms are read lazily and upserted batch_size at a time, see upsert_forms.
+
+    Args:
+        source: Path to a directory or file, or "-" for JSONL on stdin
+        batch_size: Number of forms embedded and upserted per batch
+
+    Returns:
+        dict: Totals plus forms/s and embeddings/s throughput
+    """
+    totals = {"forms": 0, "skipped": 0, "upserted": 0, "embedded": 0}
+    start = time.perf_counter()
+    forms = iter_forms(source)
+    while True:
+        batch = list(islice(forms, batch_size))
+        if not batch:
+            break
+        stats = upsert_forms(batch)
+        for key in totals:
+            totals[key] += stats[key]
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "forms progress",
+            extra={
+                **totals,
+                "forms_per_second": round(totals["forms"] / elapsed, 1),
+                "embeddings_per_second": round(totals["embedded"] / elapsed, 1),
+            },
+        )
+
+    elapsed = time.perf_counter() - start
+    totals["seconds"] = elapsed
+    totals["forms_per_second"] = totals["forms"] / elapsed if elapsed else 0.0
+    totals["embeddings_per_second"] = totals["embedded"] / elapsed if elapsed else 0.0
+    return totals
+
+
+def iter_source_paths(sources):
+    """
+    Expand corpus sources: directories are walked, files and URLs pass through.
+
+    Args:
+        sources: Iterable of file paths, directory paths and http(s) URLs
+
+    Yields:
+        str: A single file path or URL
+    """
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield source
+
+
+def load_source(source, fetch_dir=None):
+    """
+    Load one corpus source as a Document, the same way WebBaseLoader does for
+    HTML pages. URLs are fetched once and kept in fetch_dir when it is given.
+
+    Args:
+        source: File path or http(s) URL
+        fetch_dir: Directory caching fetched pages, keyed by URL hash
+
+    Returns:
+        Document: The page text with the source in its metadata
+    """
+    if source.startswith(("http://", "https://")):
+        cache_path = None
+        if fetch_dir:
+            name = hashlib.sha256(source.encode("utf-8")).hexdigest()[:32] + ".html"
+            cache_path = os.path.join(fetch_dir, name)
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, "rb") as file:
+                raw = file.read()
+        else:
+            response = requests.get(source, timeout=30)
+            response.raise_for_status()
+            raw = response.content
+            if cache_path:
+                os.makedirs(fetch_dir, exist_ok=True)
+                with open(cache_path, "wb") as file:
+                    file.write(raw)
+        is_html = True
+    else:
+        with open(source, "rb") as file:
+            raw = file.read()
+        is_html = source.endswith((".html", ".htm"))
+
+    metadata = {"source": source}
+    if is_html:
+        soup = BeautifulSoup(raw, "html.parser")
+        if soup.title and soup.title.string:
+            metadata["title"] = soup.title.string
+        text = soup.get_text()
+    else:
+        text = raw.decode("utf-8", errors="replace")
+    return Document(page_content=text, metadata=metadata)
+
+
+def clean_text(text):
+    """
+    Replace escape characters and collapse runs of whitespace.
+    """
+    text = text.replace("\n", " ").replace("\r", "").replace("\t", " ")
+    return " ".join(text.split())
+
+
+def chunk_id(source, text):
+    """
+    Content-hash ID of a chunk, stable across re-runs.
+    """
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def iter_chunks(document, splitter):
+    """
+    Split and clean a document lazily.
+
+    Yields:
+        tuple: (chunk ID, cleaned Document)
+    """
+    for chunk in splitter.split_documents([document]):
+        text = clean_text(chunk.page_content)
+        if text:
+            chunk.page_content = text
+            yield chunk_id(chunk.metadata["source"], text), chunk
+
+
+def load_checkpoint(path):
+    """
+    Returns:
+        set: Sources fully ingested by a previous run
+    """
+    if path and os.path.exists(path):
+        with open(path, "r") as file:
+            return set(json.load(file).get("completed_sources", []))
+    return set()
+
+
+def save_checkpoint(path, completed_sources):
+    if not path:
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({"completed_sources": sorted(completed_sources)}, file)
+    os.replace(tmp_path, path)
+
+
+def upsert_chunks(collection, embeddings, batch):
+    """
+    Embed and upsert the chunks of a batch that are not stored yet.
+
+    Args:
+        collection: The Chroma collection
+        embeddings: Embeddings used for the collection
+        batch: List of (source, chunk ID, Document)
+
+    Returns:
+        int: Number of chunks embedded
+    """
+    ids = [i for _, i, _ in batch]
+    existing = set(collection.get(ids=ids, include=[])["ids"])
+    new = [(i, chunk) for _, i, chunk in batch if i not in existing]
+    if new:
+        texts = [chunk.page_content for _, chunk in new]
+        collection.upsert(
+            ids=[i for i, _ in new],
+            embeddings=embeddings.embed_documents(texts),
+            documents=texts,
+            metadatas=[chunk.metadata for _, chunk in new],
+        )
+    return len(new)
+
+
+def ingest_corpus(
+    sources,
+    fetch_dir=None,
+    persist_directory="vector",
+    checkpoint_path="ingest_checkpoint.json",
+    batch_size=96,
+    workers=4,
+    chunk_size=512,
+    chunk_overlap=100,
+):
+    """
+    Build or update the full-context collection served by the retriever.
+
+    Sources are loaded, split and cleaned one at a time and their chunks are
+    embedded and upserted in batches on a pool of workers, with at most two
+    batches per worker in flight. Chunk IDs are content hashes, so chunks
+    already in the collection are not embedded again, and chunks a source no
+    longer produces are deleted once that source is done. Completed sources
+    are recorded in the checkpoint file and skipped when an interrupted run is
+    restarted.
+
+    Args:
+        sources: File paths, directories and URLs to ingest
+        fetch_dir: Directory caching fetched URLs
+        persist_directory: Chroma persist directory
+        checkpoint_path: Checkpoint file, None to disable
+        batch_size: Chunks per embedding batch
+        workers: Number of concurrent embedding batches
+        chunk_size: Splitter chunk size in characters
+        chunk_overlap: Splitter chunk overlap in characters
+
+    Returns:
+        dict: Counts of sources and chunks plus chunks/s throughput
+    """
+    collection = load_vectorstore_from_disk(persist_directory)._collection
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    completed = load_checkpoint(checkpoint_path)
+    totals = {"sources": 0, "skipped_sources": 0, "chunks": 0, "embedded": 0}
+    # source -> chunk IDs produced, batches not yet upserted, fully split
+    pending = {}
+    futures = {}
+    start = time.perf_counter()
+
+    def finish_if_done(source):
+        state = pending[source]
+        if not state["split"] or state["batches"]:
+            return
+        stored = set(collection.get(where={"source": source}, include=[])["ids"])
+        stale = list(stored - state["ids"])
+        if stale:
+            collection.delete(ids=stale)
+        del pending[source]
+        completed.add(source)
+        save_checkpoint(checkpoint_path, completed)
+
+    def collect(done):
+        for future in done:
+            batch_sources = futures.pop(future)
+            totals["embedded"] += future.result()
+            for source in batch_sources:
+                pending[source]["batches"] -= 1
+                finish_if_done(source)
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "corpus progress",
+            extra={
+                **totals,
+                "chunks_per_second": round(totals["chunks"] / elapsed, 1),
+            },
+        )
+
+    def submit(batch):
+        batch_sources = {source for source, _, _ in batch}
+        future = executor.submit(upsert_chunks, collection, embeddings, batch)
+        futures[future] = batch_sources
+        if len(futures) >= workers * 2:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        batch = []
+        for source in iter_source_paths(sources):
+            if source in completed:
+                totals["skipped_sources"] += 1
+                continue
+            totals["sources"] += 1
+            state = pending[source] = {"ids": set(), "batches": 0, "split": False}
+            for i, chunk in iter_chunks(load_source(source, fetch_dir), splitter):
+                if i in state["ids"]:
+                    continue
+                if not any(s == source for s, _, _ in batch[-1:]):
+                    state["batches"] += 1
+                state["ids"].add(i)
+                batch.append((source, i, chunk))
+                totals["chunks"] += 1
+                if len(batch) == batch_size:
+                    submit(batch)
+                    batch = []
+            state["split"] = True
+            finish_if_done(source)
+        if batch:
+            submit(batch)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            collect(done)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    totals["seconds"] = elapsed
+    totals["chunks_per_second"] = totals["chunks"] / elapsed if elapsed else 0.0
+    return totals
+
+
+def main(argv=None):
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Load data into the vector store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    forms_parser = subparsers.add_parser(
+        "forms", help="Bulk upsert forms into the form-struct-data collection"
+    )
+    forms_parser.add_argument(
+        "source", help="Directory of .json/.jsonl files, a single file, or - for stdin"
+    )
+    forms_parser.add_argument("--batch-size", type=int, default=256)
+
+    corpus_parser = subparsers.add_parser(
+        "corpus", help="Build or update the full-context collection"
+    )
+    corpus_parser.add_argument(
+        "sources", nargs="*", help="Files, directories or URLs to ingest"
+    )
+    corpus_parser.add_argument(
+        "--sources-file", help="File listing one source per line"
+    )
+    corpus_parser.add_argument("--fetch-dir", default="fetched")
+    corpus_parser.add_argument("--persist-directory", default="vector")
+    corpus_parser.add_argument("--checkpoint", default="ingest_checkpoint.json")
+    corpus_parser.add_argument(
+        "--reset", action="store_true", help="Ignore the checkpoint file"
+    )
+    corpus_parser.add_argument("--batch-size", type=int, default=96)
+    corpus_parser.add_argument("--workers", type=int, default=4)
+    corpus_parser.add_argument("--chunk-size", type=int, default=512)
+    corpus_parser.add_argument("--chunk-overlap", type=int, default=100)
+
+    args = parser.parse_args(argv)
+    if args.command == "forms":
+        totals = ingest_forms(args.source, batch_size=args.batch_size)
+        print(json.dumps(totals))
+    elif args.command == "corpus":
+        sources = list(args.sources)
+        if args.sources_file:
+            with open(args.sources_file, "r") as file:
+                sources += [line.strip() for line in file if line.strip()]
+        if args.reset and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+        totals = ingest_corpus(
+            sources,
+            fetch_dir=args.fetch_dir,
+            persist_directory=args.persist_directory,
+            checkpoint_path=args.checkpoint,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+        )
+        print(json.dumps(totals))
+
+
+if __name__ == "__main__":
+    main()
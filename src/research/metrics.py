@@ -0,0 +1,385 @@
+import functools
+import logging
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for n, v in zip(names, values)
+    )
+    return "{%s}" % pairs
+
+
+class Counter:
+    """
+    Prometheus counter with a fixed set of label names.
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(
+                    f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+                )
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus histogram with a fixed set of label names and buckets.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts, observation count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.setdefault(labels, [[0] * len(self.buckets), 0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += 1
+            state[2] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for labels, (counts, count, total) in sorted(self._values.items()):
+                bounds = self.buckets + ("+Inf",)
+                for bound, bucket_count in zip(bounds, counts + [count]):
+                    label_str = _format_labels(names, labels + (bound,))
+                    lines.append(f"{self.name}_bucket{label_str} {bucket_count}")
+                label_str = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_str} {total}")
+                lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Holds the metrics served by /metrics. Stats dicts kept elsewhere (caches,
+    router, speculation) are exported as gauges through register_stats.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._stats = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix, documentation, stats_fn):
+        """
+        Export every numeric value of the dict returned by stats_fn as a gauge
+        named <prefix>_<key>.
+        """
+        self._stats.append((prefix, documentation, stats_fn))
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for prefix, documentation, stats_fn in self._stats:
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                logger.warning(
+                    "stats collection failed", extra={"prefix": prefix, "error": str(e)}
+                )
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# HELP {prefix}_{key} {documentation}")
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+node_duration = registry.histogram(
+    "graph_node_duration_seconds", "Graph node latency", ["node"]
+)
+node_errors = registry.counter(
+    "graph_node_errors_total", "Graph node failures", ["node"]
+)
+edge_decisions = registry.counter(
+    "graph_edge_decisions_total",
+    "Branch taken at each conditional edge",
+    ["edge", "decision"],
+)
+chain_duration = registry.histogram(
+    "chain_duration_seconds",
+    "Latency of LLM chains, retriever and search tool",
+    ["chain"],
+)
+chain_errors = registry.counter(
+    "chain_errors_total", "Failures of LLM chains, retriever and search tool", ["chain"]
+)
+prompt_tokens = registry.counter(
+    "llm_prompt_tokens_total", "Prompt tokens sent per chain", ["chain"]
+)
+completion_tokens = registry.counter(
+    "llm_completion_tokens_total", "Completion tokens received per chain", ["chain"]
+)
+
+
+def track_node(name, func, afunc):
+    """
+    Wrap a node's sync and async implementations to record latency and errors.
+
+    Args:
+        name (str): The graph node name
+        func: Sync node function
+        afunc: Async node function
+
+    Returns:
+        tuple: The wrapped (func, afunc)
+    """
+
+    @functools.wraps(func)
+    def wrapped(state):
+        start = time.perf_counter()
+        logger.debug("node started", extra={"node": name})
+        try:
+            return func(state)
+        except Exception:
+            node_errors.inc(name)
+            raise
+        finally:
+            _node_finished(name, start)
+
+    @functools.wraps(afunc)
+    async def awrapped(state):
+        start = time.perf_counter()
+        logger.debug("node started", extra={"node": name})
+        try:
+            return await afunc(state)
+        except Exception:
+            node_errors.inc(name)
+            raise
+        finally:
+            _node_finished(name, start)
+
+    return wrapped, awrapped
+
+
+def _node_finished(name, start):
+    end = time.perf_counter()
+    duration = end - start
+    node_duration.observe(duration, name)
+    tracing.record("node", name, start, end)
+    logger.debug(
+        "node finished", extra={"node": name, "duration_ms": round(duration * 1000, 1)}
+    )
+
+
+def track_edge(name, func, afunc=None):
+    """
+    Wrap a conditional edge to count the branch it takes.
+
+    Args:
+        name (str): Name the edge is reported under
+        func: Sync edge function
+        afunc: Optional async edge function
+
+    Returns:
+        tuple: The wrapped (func, afunc), afunc is None if none was given
+    """
+
+    @functools.wraps(func)
+    def wrapped(state):
+        decision = func(state)
+        _edge_taken(name, decision)
+        return decision
+
+    awrapped = None
+    if afunc is not None:
+
+        @functools.wraps(afunc)
+        async def awrapped(state):
+            decision = await afunc(state)
+            _edge_taken(name, decision)
+            return decision
+
+    return wrapped, awrapped
+
+
+def _edge_taken(name, decision):
+    edge_decisions.inc(name, decision)
+    logger.debug("edge taken", extra={"edge": name, "decision": decision})
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records latency, errors and token usage of the runs named in `names`, and
+    adds them to the request trace when the request is being traced.
+
+    Chains are registered by instrument(), which gives them a run name and a
+    tag. Chat model runs inherit the tag, which is how their token usage is
+    attributed to the chain. The handler itself is passed in the config of
+    the graph run (see graph.graph_config) and inherited by every run under
+    it, alongside the callbacks astream_events and tracers add.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.names = set()
+        self._starts = {}
+        self._llm_chains = {}
+
+    def _start(self, run_id, kwargs, kind):
+        name = kwargs.get("name")
+        if name in self.names:
+            self._starts[run_id] = (name, kind, time.perf_counter())
+
+    def _end(self, run_id, error=False):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        name, kind, start = started
+        end = time.perf_counter()
+        chain_duration.observe(end - start, name)
+        tracing.record(kind, name, start, end)
+        if error:
+            chain_errors.inc(name)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        self._start(run_id, kwargs, "llm")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, kwargs, "retriever")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, kwargs, "search")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        self._remember_llm_chain(run_id, tags)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        self._remember_llm_chain(run_id, tags)
+
+    def _remember_llm_chain(self, run_id, tags):
+        for tag in tags or []:
+            if tag in self.names:
+                self._llm_chains[run_id] = tag
+                return
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        chain = self._llm_chains.pop(run_id, None)
+        if chain is None:
+            return
+        prompt, completion = _token_usage(response)
+        prompt_tokens.inc(chain, amount=prompt)
+        completion_tokens.inc(chain, amount=completion)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._llm_chains.pop(run_id, None)
+
+
+def _token_usage(response):
+    """
+    Prompt and completion token counts of an LLMResult, from the message usage
+    metadata when present, else from the provider's llm_output.
+    """
+    prompt = completion = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+    if not prompt and not completion and response.llm_output:
+        usage = response.llm_output.get("token_usage") or {}
+        prompt = usage.get("prompt_tokens", 0)
+        completion = usage.get("completion_tokens", 0)
+    return prompt, completion
+
+
+metrics_callback = MetricsCallbackHandler()
+
+
+def instrument(runnable, name):
+    """
+    Name and tag a chain, retriever or tool so metrics_callback reports it.
+
+    Binding callbacks here would replace the ones the run inherits from the
+    graph, so only the run name and tag are bound.
+
+    Args:
+        runnable: The runnable to instrument
+        name (str): Name it is reported under
+
+    Returns:
+        Runnable: The runnable bound to its run name and tag
+    """
+    metrics_callback.names.add(name)
+    return runnable.with_config(run_name=name, tags=[name])
@@ -1,22 +1,80 @@
-import json
-from langchain.schema import Document
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from utils import (
     fill_form_with_user_data,
-    flatten_form_data,
     get_user_profile,
-    query_form_data,
+    get_form_struct_data,
+    aget_form_struct_data,
 )
+from profile_client import profile_client
+import tracing
+from bm25 import PREGRADE_ENABLED, bm25_index
+from packing import pack_context
+from router import LOCAL_ROUTER_ENABLED, local_router
+from websearch import arank_web_results, rank_web_results, web_search_cache
 from tools import (
     retriever,
     rag_chain,
     retrieval_grader,
-    web_search_tool,
     question_router,
     intent_classifier,
     hallucination_grader,
     answer_grader,
+    combined_grader,
 )
 
+logger = logging.getLogger(__name__)
+
+# Maximum number of retrieval_grader calls in flight for one grade_documents run.
+# Set to 1 to grade documents one at a time.
+GRADE_CONCURRENCY = int(os.environ.get("GRADE_CONCURRENCY", "7"))
+# Stop grading as soon as one document is graded "no"; decide_to_generate only
+# looks at the web_search flag, so the remaining grades are not needed.
+GRADE_SHORT_CIRCUIT = os.environ.get("GRADE_SHORT_CIRCUIT", "false").lower() == "true"
+
+# Start the Chroma retrieval, and optionally the web search, while the router
+# decides. The branch the router picks consumes the result, the other one is
+# cancelled. Only the async graph path speculates.
+SPECULATIVE_RETRIEVAL = (
+    os.environ.get("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+)
+SPECULATIVE_WEBSEARCH = (
+    os.environ.get("SPECULATIVE_WEBSEARCH", "false").lower() == "true"
+)
+# Cost guard: speculative Tavily calls started per rolling minute
+SPECULATIVE_WEBSEARCH_PER_MINUTE = int(
+    os.environ.get("SPECULATIVE_WEBSEARCH_PER_MINUTE", "30")
+)
+# "two_call": hallucination_grader then answer_grader, "combined": one
+# combined_grader call returning both verdicts
+GENERATION_GRADER_MODE = os.environ.get("GENERATION_GRADER_MODE", "two_call")
+
+# Per-request latency budget. Once less than GENERATE_RESERVE_SECONDS remain,
+# the router LLM, web search and graders are skipped, and grader calls still
+# running are given up on. Then, or once MAX_GENERATIONS generations were
+# made, the latest generation is returned flagged as unverified.
+REQUEST_BUDGET_SECONDS = float(os.environ.get("REQUEST_BUDGET_SECONDS", "20"))
+GENERATE_RESERVE_SECONDS = float(os.environ.get("GENERATE_RESERVE_SECONDS", "4"))
+MAX_GENERATIONS = int(os.environ.get("MAX_GENERATIONS", "3"))
+
+# Estimated tokens of documents packed into the rag_chain and grader prompts,
+# leaving room in llama3-70b-8192's context for the template and the answer
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+
+speculation_stats = {
+    "vectorstore_started": 0,
+    "vectorstore_used": 0,
+    "websearch_started": 0,
+    "websearch_used": 0,
+    "websearch_guarded": 0,
+}
+_speculative_websearch_starts = deque()
+
 
 def retrieve(state):
     """
@@ -28,13 +86,17 @@ def retrieve(state):
     Returns:
         state (dict): New key added to state, documents, that contains retrieved documents
     """
-    print("Running retrieve function...")
     question: str = state.get("question", "")
     # Initialize documents as empty list
 
-    documents = retriever.invoke(question)
+    prefetched = state.get("prefetched") or {}
+    if "vectorstore" in prefetched:
+        documents = prefetched["vectorstore"]
+    else:
+        documents = retriever.invoke(question)
 
-    return {"documents": documents, "question": question}
+    # The prefetch is consumed, don't carry it through the rest of the run
+    return {"documents": documents, "question": question, "prefetched": {}}
 
 
 def generate(state):
@@ -47,13 +109,19 @@ def generate(state):
     Returns:
         state (dict): New key added to state, generation, that contains LLM generation
     """
-    print("Running generate function...")
     question = state["question"]
     documents = state["documents"]
 
-    # RAG generation
-    generation = rag_chain.invoke({"context": documents, "question": question})
-    return {"documents": documents, "question": question, "generation": generation}
+    # RAG generation, the graders reuse the packed context
+    context = pack_context(documents, question, CONTEXT_TOKEN_BUDGET)
+    generation = rag_chain.invoke({"context": context, "question": question})
+    return {
+        "documents": documents,
+        "question": question,
+        "generation": generation,
+        "packed_context": context,
+        **count_generation(state),
+    }
 
 
 def grade_documents(state):
@@ -67,29 +135,118 @@ def grade_documents(state):
     Returns:
         state (dict): Filtered out irrelevant documents and updated web_search state
     """
-    print("Running grade_documents function...")
-    print("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
     question = state["question"]
     documents = state["documents"]
 
-    # Score each doc
-    filtered_docs = []
-    web_search = "No"
-    for d in documents:
-        score = retrieval_grader.invoke(
-            {"question": question, "document": d.page_content}
-        )
-        grade = score["score"]
-        # Document relevant
-        if grade.lower() == "yes":
-            filtered_docs.append(d)
-        # Document not relevant
-        else:
-            web_search = "Yes"
-            continue
+    if out_of_time(state):
+        logger.info("latency budget low, skipping document grading")
+        return {"documents": documents, "question": question, "web_search": "No"}
+
+    grades = grade_documents_concurrently(
+        question,
+        documents,
+        GRADE_CONCURRENCY,
+        GRADE_SHORT_CIRCUIT,
+        state.get("deadline"),
+    )
+
+    # Keep relevant docs in their original order
+    filtered_docs = [d for d, grade in zip(documents, grades) if grade]
+    web_search = "Yes" if False in grades else "No"
     return {"documents": filtered_docs, "question": question, "web_search": web_search}
 
 
+def is_relevant(question, document):
+    """
+    Grade a single document against the question with the retrieval grader.
+
+    Args:
+        question (str): The user question
+        document (Document): The retrieved document
+
+    Returns:
+        bool: True if the grader scored the document as relevant
+    """
+    score = retrieval_grader.invoke(
+        {"question": question, "document": document.page_content}
+    )
+    return score["score"].lower() == "yes"
+
+
+def pregrade(question, documents):
+    """
+    Grade the documents that BM25 is confident about without the LLM.
+
+    Returns:
+        list: One entry per document; True/False when BM25 decided, None for
+        documents left to retrieval_grader (all of them with PREGRADE_ENABLED
+        unset)
+    """
+    if not PREGRADE_ENABLED:
+        return [None] * len(documents)
+    try:
+        return [bm25_index.grade(question, d.page_content) for d in documents]
+    except Exception as e:
+        logger.warning("bm25 pre-grade failed", extra={"error": str(e)})
+        return [None] * len(documents)
+
+
+def grade_documents_concurrently(
+    question,
+    documents,
+    max_concurrency=GRADE_CONCURRENCY,
+    short_circuit=False,
+    deadline=None,
+):
+    """
+    Grade documents with up to max_concurrency grader calls in flight, after
+    the BM25 pre-grade settled the ones it could.
+
+    Args:
+        question (str): The user question
+        documents (list): The retrieved documents
+        max_concurrency (int): Maximum number of concurrent grader calls
+        short_circuit (bool): Stop at the first irrelevant document and cancel
+            the grader calls that have not started yet
+        deadline (float): Request deadline, grades still missing when the
+            budget runs low are given the benefit of the doubt, as are
+            documents whose grader call failed
+
+    Returns:
+        list: One entry per document, in the same order; True/False for graded
+        documents and None for documents skipped by the short-circuit
+    """
+    grades = pregrade(question, documents)
+    pending = [i for i, grade in enumerate(grades) if grade is None]
+    if not pending or (short_circuit and False in grades):
+        return grades
+
+    def grade(i):
+        try:
+            return is_relevant(question, documents[i])
+        except Exception as e:
+            logger.warning("grading failed, keeping document", extra={"error": str(e)})
+            return True
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_concurrency, len(pending)))
+    )
+    futures = {executor.submit(grade, i): i for i in pending}
+    try:
+        for future in as_completed(futures, timeout=time_left(deadline)):
+            grades[futures[future]] = future.result()
+            if short_circuit and grades[futures[future]] is False:
+                logger.debug("irrelevant document found, skipping remaining grades")
+                break
+    except FuturesTimeoutError:
+        logger.info("latency budget low, keeping ungraded documents")
+        grades = [True if grade is None else grade for grade in grades]
+    finally:
+        # Calls already running finish in the background, their grades are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+    return grades
+
+
 def web_search(state):
     """
     Web search based based on the question
@@ -100,20 +257,23 @@ def web_search(state):
     Returns:
         state (dict): Appended web results to documents
     """
-    print("Running web_search function...")
     question = state["question"]
     # Initialize documents as empty list if it doesn't exist
     documents = state.get("documents", [])
 
     # Web search
-    docs = web_search_tool.invoke({"query": question})
-    web_results = "\n".join([d["content"] for d in docs])
-    web_results = Document(page_content=web_results)
-    if documents:
-        documents.append(web_results.page_content)
+    prefetched = state.get("prefetched") or {}
+    if "websearch" in prefetched:
+        docs = prefetched["websearch"]
+    elif out_of_time(state):
+        logger.info("latency budget low, skipping web search")
+        return {"documents": documents, "question": question, "prefetched": {}}
     else:
-        documents = [web_results.page_content]
-    return {"documents": documents, "question": question}
+        docs = web_search_cache.search(question)
+    # Only the most relevant chunks, within the web token budget
+    documents = list(documents) + rank_web_results(question, docs, documents)
+    # The prefetch is consumed, later websearch rounds search again
+    return {"documents": documents, "question": question, "prefetched": {}}
 
 
 def route_question(state):
@@ -124,25 +284,59 @@ def route_question(state):
         state (dict): The current graph state
 
     Returns:
-        str: Next node to call
+        state (dict): New key added to state, datasource, the next node to call
     """
-    print("Running route_question function...")
     question = state["question"]
-    print(question)
+    if out_of_time(state):
+        logger.info("latency budget low, routing to the vectorstore")
+        return {"datasource": "vectorstore"}
+    if LOCAL_ROUTER_ENABLED:
+        route = local_router.route(question)
+        if route is not None:
+            return {"datasource": route}
     source = question_router.invoke({"question": question})
-    print(source)
-    print(source["datasource"])
-    if source["datasource"] == "web_search":
+    logger.debug("question routed", extra={"datasource": source["datasource"]})
+    return {"datasource": datasource_to_route(source["datasource"])}
+
+
+def datasource_to_route(datasource):
+    """
+    Map the router's datasource to the route_question edge names.
+    """
+    if datasource == "web_search":
         return "websearch"
-    elif source["datasource"] == "vectorstore":
+    elif datasource == "vectorstore":
         return "vectorstore"
 
 
-def route_intent(state):
-    print("Running route_intent function...")
+def classify_intent(state):
+    """
+    Classify the question as a command or question answering. Runs at entry,
+    in parallel with route_question, since it only needs the question.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): New key added to state, intent
+    """
     question = state["question"]
     classification = intent_classifier.invoke({"question": question})
-    return classification
+    return {"intent": classification["intent"]}
+
+
+def route_intent(state):
+    """
+    Join point after a useful generation. The intent was already classified by
+    classify_intent, the route_intent edge reads it from the state.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): No changes
+    """
+    return {}
 
 
 # Conditional edges
@@ -156,12 +350,14 @@ def decide_to_generate(state):
     Returns:
         str: Binary decision for next node to call
     """
-    print("Running decide_to_generate function...")
     question = state["question"]
     web_search = state["web_search"]
     filtered_documents = state["documents"]
 
-    if web_search == "Yes":
+    if web_search == "Yes" and out_of_time(state):
+        logger.info("latency budget low, generating without web search")
+        return "generate"
+    elif web_search == "Yes":
         # All documents have been filtered check_relevance
         # We will re-generate a new query
 
@@ -182,11 +378,20 @@ def grade_generation_v_documents_and_question(state):
     Returns:
         str: Decision for next node to call
     """
-    print("Running grade_generation_v_documents_and_question function...")
     question = state["question"]
-    documents = state["documents"]
+    documents = generation_context(state)
     generation = state["generation"]
 
+    if state.get("unverified"):
+        logger.info("latency or retry budget spent, skipping generation graders")
+        return "unverified"
+
+    if GENERATION_GRADER_MODE == "combined":
+        score = combined_grader.invoke(
+            {"documents": documents, "generation": generation, "question": question}
+        )
+        return combined_grade_to_decision(score)
+
     score = hallucination_grader.invoke(
         {"documents": documents, "generation": generation}
     )
@@ -204,6 +409,81 @@ def grade_generation_v_documents_and_question(state):
         return "not supported"
 
 
+def generation_context(state):
+    """
+    The packed context the generation being graded was made from.
+    """
+    if state.get("packed_context") is not None:
+        return state["packed_context"]
+    return pack_context(state["documents"], state["question"], CONTEXT_TOKEN_BUDGET)
+
+
+def request_budget():
+    """
+    Budget fields for the initial state of a request.
+
+    Returns:
+        dict: deadline (epoch seconds), generations made and max_generations
+    """
+    return {
+        "deadline": time.time() + REQUEST_BUDGET_SECONDS,
+        "generations": 0,
+        "max_generations": MAX_GENERATIONS,
+    }
+
+
+def out_of_time(state):
+    """
+    Returns:
+        bool: True if the request can no longer afford anything but a final
+        generation. Requests started without a deadline never run out.
+    """
+    deadline = state.get("deadline")
+    return deadline is not None and time.time() + GENERATE_RESERVE_SECONDS >= deadline
+
+
+def time_left(deadline):
+    """
+    Returns:
+        float: Seconds until out_of_time fires for a request with this
+        deadline, None for requests without one
+    """
+    if deadline is None:
+        return None
+    return max(0.0, deadline - GENERATE_RESERVE_SECONDS - time.time())
+
+
+def count_generation(state):
+    """
+    Budget updates for generate: count the generation and flag it unverified
+    if there is no budget left to grade it or to try again.
+
+    Returns:
+        dict: generations and unverified state updates
+    """
+    generations = (state.get("generations") or 0) + 1
+    max_generations = state.get("max_generations") or MAX_GENERATIONS
+    unverified = out_of_time(state) or generations >= max_generations
+    return {"generations": generations, "unverified": unverified}
+
+
+def combined_grade_to_decision(score):
+    """
+    Map the combined_grader verdicts to the same outcomes as the two-call mode.
+
+    Args:
+        score (dict): combined_grader output with 'grounded' and 'useful' keys
+
+    Returns:
+        str: "useful", "not useful" or "not supported"
+    """
+    if score["grounded"] != "yes":
+        return "not supported"
+    if score["useful"] == "yes":
+        return "useful"
+    return "not useful"
+
+
 def entry_data(state):
     """
     This node doesn't modify the state - it simply passes it through without changes.
@@ -215,38 +495,334 @@ def entry_data(state):
     Returns:
         state (dict): The unchanged state
     """
-    print("Running entry_data function...")
-    print(
-        "This goes as an entry for parallel action of getting user data and form data"
-    )
     return state
 
 
 def user_data_sql(state):
-    print("Running user_data_sql function...")
-    # Get user data
-    # user_id = state["context"]
-
-    user_data = "get_user_profile(user_id)"
-    print("USER DATA\n\n")
-    print(user_data)
+    # Get user data, graph.py puts the user id in context
+    user_data = get_user_profile(state["context"])
+    logger.debug("user data", extra={"user_data": user_data})
     return {"user_data": user_data}
 
 
 def get_form_struct(state):
-    print("Running get_form_struct function...")
     # form data from RAG
 
-    # call the RAG function
-    json_data = query_form_data(state["generation"])
-    data = flatten_form_data(json_data)
-    print("FORM STRUCT\n\n")
-    print(json.dumps(data))
+    # look the form up in the preloaded form index
+    data = get_form_struct_data(state["generation"])
+    logger.debug("form struct", extra={"form_struct": data})
     return {"form_struct": data}
 
 
 def merge_node(state):
-    print("Running merge_node function...")
     # Takes keys from user_data and adds it to form struct
     merged = fill_form_with_user_data(state["form_struct"], state["user_data"])
-    return {"form_struct": state["form_struct"]}
+    return {"form_struct": merged}
+
+
+# Async implementations of the nodes and conditional edges above. The graph pairs
+# each one with its sync version so app_workflow.ainvoke awaits the chains
+# instead of holding a worker thread per request.
+
+
+async def aretrieve(state):
+    """
+    Async version of retrieve.
+    """
+    question: str = state.get("question", "")
+
+    prefetched = state.get("prefetched") or {}
+    if "vectorstore" in prefetched:
+        documents = prefetched["vectorstore"]
+    else:
+        documents = await retriever.ainvoke(question)
+
+    return {"documents": documents, "question": question, "prefetched": {}}
+
+
+async def agenerate(state):
+    """
+    Async version of generate.
+    """
+    question = state["question"]
+    documents = state["documents"]
+
+    context = pack_context(documents, question, CONTEXT_TOKEN_BUDGET)
+    generation = await rag_chain.ainvoke({"context": context, "question": question})
+    return {
+        "documents": documents,
+        "question": question,
+        "generation": generation,
+        "packed_context": context,
+        **count_generation(state),
+    }
+
+
+async def agrade_documents(state):
+    """
+    Async version of grade_documents.
+    """
+    question = state["question"]
+    documents = state["documents"]
+
+    if out_of_time(state):
+        logger.info("latency budget low, skipping document grading")
+        return {"documents": documents, "question": question, "web_search": "No"}
+
+    grades = await agrade_documents_concurrently(
+        question,
+        documents,
+        GRADE_CONCURRENCY,
+        GRADE_SHORT_CIRCUIT,
+        state.get("deadline"),
+    )
+
+    filtered_docs = [d for d, grade in zip(documents, grades) if grade]
+    web_search = "Yes" if False in grades else "No"
+    return {"documents": filtered_docs, "question": question, "web_search": web_search}
+
+
+async def ais_relevant(question, document):
+    """
+    Async version of is_relevant.
+    """
+    score = await retrieval_grader.ainvoke(
+        {"question": question, "document": document.page_content}
+    )
+    return score["score"].lower() == "yes"
+
+
+async def apregrade(question, documents):
+    """
+    Async version of pregrade. The first call builds the BM25 statistics in a
+    worker thread instead of on the event loop.
+    """
+    if PREGRADE_ENABLED and not bm25_index.loaded:
+        try:
+            await asyncio.to_thread(bm25_index.ensure_loaded)
+        except Exception as e:
+            logger.warning("bm25 pre-grade failed", extra={"error": str(e)})
+            return [None] * len(documents)
+    return pregrade(question, documents)
+
+
+async def agrade_documents_concurrently(
+    question,
+    documents,
+    max_concurrency=GRADE_CONCURRENCY,
+    short_circuit=False,
+    deadline=None,
+):
+    """
+    Async version of grade_documents_concurrently. Grader calls still pending
+    when the short-circuit fires are cancelled, including the running ones.
+    """
+    grades = await apregrade(question, documents)
+    pending = [i for i, grade in enumerate(grades) if grade is None]
+    if not pending or (short_circuit and False in grades):
+        return grades
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def grade(i):
+        async with semaphore:
+            try:
+                return i, await ais_relevant(question, documents[i])
+            except Exception as e:
+                logger.warning(
+                    "grading failed, keeping document", extra={"error": str(e)}
+                )
+                return i, True
+
+    tasks = [asyncio.create_task(grade(i)) for i in pending]
+    try:
+        async with asyncio.timeout(time_left(deadline)):
+            for next_done in asyncio.as_completed(tasks):
+                i, relevant = await next_done
+                grades[i] = relevant
+                if short_circuit and not relevant:
+                    logger.debug(
+                        "irrelevant document found, skipping remaining grades"
+                    )
+                    break
+    except TimeoutError:
+        logger.info("latency budget low, keeping ungraded documents")
+        grades = [True if grade is None else grade for grade in grades]
+    finally:
+        for task in tasks:
+            task.cancel()
+    return grades
+
+
+async def aweb_search(state):
+    """
+    Async version of web_search.
+    """
+    question = state["question"]
+    documents = state.get("documents", [])
+
+    prefetched = state.get("prefetched") or {}
+    if "websearch" in prefetched:
+        docs = prefetched["websearch"]
+    elif out_of_time(state):
+        logger.info("latency budget low, skipping web search")
+        return {"documents": documents, "question": question, "prefetched": {}}
+    else:
+        docs = await web_search_cache.asearch(question)
+    documents = list(documents) + await arank_web_results(question, docs, documents)
+    return {"documents": documents, "question": question, "prefetched": {}}
+
+
+async def aroute_question(state):
+    """
+    Async version of route_question. With SPECULATIVE_RETRIEVAL or
+    SPECULATIVE_WEBSEARCH set, the matching branch is fetched while the router
+    runs and handed to retrieve/web_search in state["prefetched"].
+    """
+    question = state["question"]
+    if out_of_time(state):
+        logger.info("latency budget low, routing to the vectorstore")
+        return {"datasource": "vectorstore"}
+
+    tasks = {}
+    if SPECULATIVE_RETRIEVAL:
+        tasks["vectorstore"] = asyncio.create_task(retriever.ainvoke(question))
+        speculation_stats["vectorstore_started"] += 1
+    if SPECULATIVE_WEBSEARCH:
+        if allow_speculative_websearch():
+            tasks["websearch"] = asyncio.create_task(
+                web_search_cache.asearch(question)
+            )
+            speculation_stats["websearch_started"] += 1
+        else:
+            speculation_stats["websearch_guarded"] += 1
+
+    try:
+        route = None
+        if LOCAL_ROUTER_ENABLED:
+            route = await local_router.aroute(question)
+        if route is None:
+            source = await question_router.ainvoke({"question": question})
+            logger.debug("question routed", extra={"datasource": source["datasource"]})
+            route = datasource_to_route(source["datasource"])
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    prefetched = {}
+    for name, task in tasks.items():
+        if name != route:
+            task.cancel()
+            continue
+        try:
+            prefetched[name] = await task
+            speculation_stats[f"{name}_used"] += 1
+        except Exception as e:
+            # The node fetches it again itself
+            logger.warning(
+                "speculative fetch failed", extra={"branch": name, "error": str(e)}
+            )
+    if tasks:
+        speculation = {
+            "started": list(tasks),
+            "used": list(prefetched),
+            "wasted": [name for name in tasks if name not in prefetched],
+        }
+        logger.info("speculation", extra=speculation)
+        tracing.annotate("speculation", speculation)
+    return {"datasource": route, "prefetched": prefetched}
+
+
+def allow_speculative_websearch():
+    """
+    Returns:
+        bool: True if a speculative web search may start without exceeding
+        SPECULATIVE_WEBSEARCH_PER_MINUTE
+    """
+    now = time.monotonic()
+    while _speculative_websearch_starts and now - _speculative_websearch_starts[0] > 60:
+        _speculative_websearch_starts.popleft()
+    if len(_speculative_websearch_starts) >= SPECULATIVE_WEBSEARCH_PER_MINUTE:
+        return False
+    _speculative_websearch_starts.append(now)
+    return True
+
+
+async def aclassify_intent(state):
+    """
+    Async version of classify_intent.
+    """
+    question = state["question"]
+    classification = await intent_classifier.ainvoke({"question": question})
+    return {"intent": classification["intent"]}
+
+
+async def aroute_intent(state):
+    return route_intent(state)
+
+
+async def adecide_to_generate(state):
+    """
+    Async version of decide_to_generate.
+    """
+    return decide_to_generate(state)
+
+
+async def agrade_generation_v_documents_and_question(state):
+    """
+    Async version of grade_generation_v_documents_and_question.
+    """
+    question = state["question"]
+    documents = generation_context(state)
+    generation = state["generation"]
+
+    if state.get("unverified"):
+        logger.info("latency or retry budget spent, skipping generation graders")
+        return "unverified"
+
+    if GENERATION_GRADER_MODE == "combined":
+        score = await combined_grader.ainvoke(
+            {"documents": documents, "generation": generation, "question": question}
+        )
+        return combined_grade_to_decision(score)
+
+    score = await hallucination_grader.ainvoke(
+        {"documents": documents, "generation": generation}
+    )
+    grade = score["score"]
+
+    if grade == "yes":
+        score = await answer_grader.ainvoke(
+            {"question": question, "generation": generation}
+        )
+        grade = score["score"]
+        if grade == "yes":
+            return "useful"
+        else:
+            return "not useful"
+    else:
+        return "not supported"
+
+
+async def aentry_data(state):
+    return entry_data(state)
+
+
+async def auser_data_sql(state):
+    """
+    Async version of user_data_sql, through the pooled and cached profile client.
+    """
+    user_data = await profile_client.get(state["context"])
+    logger.debug("user data", extra={"user_data": user_data})
+    return {"user_data": user_data}
+
+
+async def aget_form_struct(state):
+    data = await aget_form_struct_data(state["generation"])
+    logger.debug("form struct", extra={"form_struct": data})
+    return {"form_struct": data}
+
+
+async def amerge_node(state):
+    return merge_node(state)
@@ -0,0 +1,214 @@
+import re
+
+import numpy as np
+
+
+def estimate_tokens(text):
+    """
+    Rough token count of a text, about four characters per Llama 3 token.
+    """
+    return len(text) // 4 + 1
+
+
+def normalize_text(text):
+    """
+    Lowercase and collapse whitespace, for exact duplicate detection.
+    """
+    return " ".join(text.lower().split())
+
+
+def split_text(text, chunk_size):
+    """
+    Split a text into chunks of at most about chunk_size characters, on
+    paragraph, then sentence, then word boundaries.
+
+    Args:
+        text (str): The text to split
+        chunk_size (int): Target chunk size in characters
+
+    Returns:
+        list: Non-empty chunks in their original order
+    """
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        current = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > chunk_size:
+                # A single over-long sentence, cut it at a word boundary
+                cut = sentence.rfind(" ", 0, chunk_size)
+                cut = cut if cut > 0 else chunk_size
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+            if current and len(current) + 1 + len(sentence) > chunk_size:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return [chunk for chunk in chunks if chunk]
+
+
+def select_chunks(
+    query_embedding, chunk_embeddings, chunks, token_budget, duplicate_threshold
+):
+    """
+    Pick the chunks most similar to the query that fit in the token budget.
+
+    Chunks are taken by descending cosine similarity to the query, skipping
+    any whose similarity to an already picked chunk reaches
+    duplicate_threshold, and any that would overflow the budget.
+
+    Args:
+        query_embedding: Embedding of the query
+        chunk_embeddings: One embedding per chunk
+        chunks (list): The chunk texts
+        token_budget (int): Maximum estimated tokens of the picked chunks
+        duplicate_threshold (float): Cosine similarity at which two chunks
+            are near-duplicates
+
+    Returns:
+        list: Indices of the picked chunks, most similar first
+    """
+    if not chunks:
+        return []
+    matrix = np.asarray(chunk_embeddings, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(np.linalg.norm(query), 1e-12)
+
+    picked = []
+    used = 0
+    for i in np.argsort(-(matrix @ query)):
+        tokens = estimate_tokens(chunks[i])
+        if used + tokens > token_budget:
+            continue
+        if picked and float((matrix[picked] @ matrix[i]).max()) >= duplicate_threshold:
+            continue
+        picked.append(int(i))
+        used += tokens
+    return picked
+
+
+def fit_budget(chunks, token_budget):
+    """
+    Leading chunks that fit in the token budget, for when they cannot be
+    ranked.
+    """
+    fitted = []
+    used = 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if used + tokens > token_budget:
+            break
+        fitted.append(chunk)
+        used += tokens
+    return fitted
+
+
+def document_text(document):
+    """
+    Text of a retrieved Document or of a web search string.
+    """
+    return getattr(document, "page_content", document).strip()
+
+
+def trim_overlap(kept, text, min_overlap, max_overlap):
+    """
+    Remove from text what it repeats of the kept texts: the whole text if it
+    is contained in one of them, else a leading or trailing run of at least
+    min_overlap characters shared with the end or start of a kept text, as
+    left by the corpus splitter's chunk overlap.
+
+    Returns:
+        str: The remaining text, empty if nothing new is left
+    """
+    for other in kept:
+        if text in other:
+            return ""
+        for n in range(min(len(other), len(text), max_overlap), min_overlap - 1, -1):
+            if other.endswith(text[:n]):
+                text = text[n:].strip()
+                break
+            if other.startswith(text[-n:]):
+                text = text[:-n].strip()
+                break
+    return text
+
+
+def lexical_relevance(question, text):
+    """
+    Share of the question's words that appear in the text.
+    """
+    terms = {word for word in re.findall(r"\w+", question.lower()) if len(word) > 2}
+    if not terms:
+        return 0.0
+    words = set(re.findall(r"\w+", text.lower()))
+    return len(terms & words) / len(terms)
+
+
+def trim_to_budget(text, question, token_budget):
+    """
+    Cut a text that doesn't fit down to its sentences sharing words with the
+    question, in their original order, while they fit in token_budget.
+
+    Returns:
+        str: The kept sentences, empty if none fit
+    """
+    kept = []
+    used = 0
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        if not lexical_relevance(question, sentence):
+            continue
+        tokens = estimate_tokens(sentence)
+        if used + tokens > token_budget:
+            continue
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def pack_context(documents, question, token_budget, min_overlap=40, max_overlap=200):
+    """
+    Build the context of a prompt from the documents in the state.
+
+    Documents are turned into text, texts already covered by a previous one
+    are dropped and overlapping runs trimmed. The rest are added in their
+    incoming order, which carries the retriever's ranking and the graders'
+    verdicts, while they fit in token_budget. A text that doesn't fit is cut
+    down to its sentences sharing words with the question, see
+    trim_to_budget.
+
+    Args:
+        documents (list): Documents and web search strings
+        question (str): The user question
+        token_budget (int): Maximum estimated tokens of the context
+        min_overlap (int): Shortest shared run of characters trimmed
+        max_overlap (int): Longest shared run of characters looked for
+
+    Returns:
+        str: The packed context, texts separated by blank lines
+    """
+    texts = []
+    for document in documents:
+        text = trim_overlap(texts, document_text(document), min_overlap, max_overlap)
+        if text:
+            texts.append(text)
+    packed = []
+    used = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            text = trim_to_budget(text, question, token_budget - used)
+            if not text:
+                continue
+            tokens = estimate_tokens(text)
+        packed.append(text)
+        used += tokens
+    return "\n\n".join(packed)
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+
+from cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+BACKEND_URL = os.environ.get("BACKEND_URL")
+PROFILE_TIMEOUT_SECONDS = float(os.environ.get("PROFILE_TIMEOUT_SECONDS", "5"))
+PROFILE_RETRIES = int(os.environ.get("PROFILE_RETRIES", "2"))
+PROFILE_RETRY_BACKOFF_SECONDS = float(
+    os.environ.get("PROFILE_RETRY_BACKOFF_SECONDS", "0.2")
+)
+PROFILE_MAX_CONNECTIONS = int(os.environ.get("PROFILE_MAX_CONNECTIONS", "20"))
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", "300"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+
+# Worth retrying: the backend is restarting, overloaded or rate limiting
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class ProfileClient:
+    """
+    Async client for the backend's /ml/profile/{user_id} endpoint.
+
+    Requests go through one pooled httpx client with a timeout, and failed
+    connections, timeouts and retryable status codes are retried up to
+    `retries` times with exponential backoff. Profiles are cached per user for
+    cache_ttl seconds, least recently used first out once cache_max_entries is
+    reached, and concurrent lookups of the same user share one request.
+    Errors, including a response body that is not a JSON object, are returned
+    in the same shape as utils.get_user_profile and are not cached.
+    """
+
+    def __init__(
+        self,
+        base_url=BACKEND_URL,
+        timeout=PROFILE_TIMEOUT_SECONDS,
+        retries=PROFILE_RETRIES,
+        retry_backoff=PROFILE_RETRY_BACKOFF_SECONDS,
+        max_connections=PROFILE_MAX_CONNECTIONS,
+        cache_ttl=PROFILE_CACHE_TTL,
+        cache_max_entries=PROFILE_CACHE_MAX_ENTRIES,
+        transport=None,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.max_connections = max_connections
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.transport = transport
+
+        self._client = None
+        self._cache = OrderedDict()
+        self._single_flight = SingleFlight()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "requests": 0,
+            "retries": 0,
+            "errors": 0,
+        }
+
+    async def get(self, user_id):
+        """
+        Args:
+            user_id: User ID to fetch the profile for
+
+        Returns:
+            dict: User profile data or error message
+        """
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(user_id)
+            self._stats["hits"] += 1
+            return entry[1]
+        self._stats["misses"] += 1
+        profile, _ = await self._single_flight.run(
+            user_id, lambda: self._fetch(user_id)
+        )
+        return profile
+
+    def invalidate(self, user_id=None):
+        """
+        Drop the cached profile of a user, or of every user.
+        """
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(user_id, None)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        """
+        Returns:
+            dict: Cache hit/miss, request, retry and error counters
+        """
+        return {**self._stats, "cached": len(self._cache)}
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                headers={"Content-Type": "application/json"},
+                transport=self.transport,
+            )
+        return self._client
+
+    async def _fetch(self, user_id):
+        if not self.base_url:
+            return {"error": True, "message": "BACKEND_URL is not set"}
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._stats["retries"] += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            self._stats["requests"] += 1
+            try:
+                response = await self._get_client().get(f"/ml/profile/{user_id}")
+            except httpx.TransportError as e:
+                # Connection failures and timeouts
+                error = {"error": True, "message": f"Exception occurred: {str(e)}"}
+                continue
+            except httpx.HTTPError as e:
+                error = {"error": True, "message": f"Exception occurred: {str(e)}"}
+                break
+            if response.status_code == 200:
+                try:
+                    profile = response.json()
+                except ValueError:
+                    # Not JSON at all
+                    profile = None
+                if isinstance(profile, dict):
+                    self._remember(user_id, profile)
+                    return profile
+                error = {
+                    "error": True,
+                    "message": "Invalid user profile response",
+                    "status_code": response.status_code,
+                }
+                break
+            error = {
+                "error": True,
+                "message": f"Failed to fetch user profile: {response.status_code}",
+                "status_code": response.status_code,
+            }
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+
+        self._stats["errors"] += 1
+        logger.warning(
+            "user profile fetch failed",
+            extra={"user_id": user_id, "error": error["message"]},
+        )
+        return error
+
+    def _remember(self, user_id, profile):
+        self._cache[user_id] = (time.monotonic() + self.cache_ttl, profile)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+
+profile_client = ProfileClient()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+from typing import Any, List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# The retriever fetches RETRIEVAL_CANDIDATES nearest chunks with their stored
+# embeddings and keeps RETRIEVAL_TOP_N of them by maximal marginal relevance.
+# RETRIEVAL_MMR_LAMBDA weighs relevance to the question against diversity:
+# 1 ranks by similarity alone, lower values push out overlapping chunks.
+RETRIEVAL_CANDIDATES = int(os.environ.get("RETRIEVAL_CANDIDATES", "20"))
+RETRIEVAL_TOP_N = int(os.environ.get("RETRIEVAL_TOP_N", "4"))
+RETRIEVAL_MMR_LAMBDA = float(os.environ.get("RETRIEVAL_MMR_LAMBDA", "0.7"))
+
+
+def mmr(query_embedding, embeddings, top_n, lambda_mult):
+    """
+    Maximal marginal relevance over a candidate set.
+
+    Args:
+        query_embedding: Embedding of the question
+        embeddings: One embedding per candidate
+        top_n (int): Number of candidates to pick
+        lambda_mult (float): 1 for pure relevance, 0 for pure diversity
+
+    Returns:
+        list: Indices of the picked candidates, in pick order
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if not len(matrix):
+        return []
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    relevance = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+    top_n = min(top_n, len(matrix))
+    if lambda_mult >= 1:
+        return [int(i) for i in np.argsort(-relevance)[:top_n]]
+
+    similarity = matrix @ matrix.T
+    picked = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything picked so far
+    redundancy = similarity[picked[0]].copy()
+    while len(picked) < top_n:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[picked] = -np.inf
+        i = int(np.argmax(scores))
+        picked.append(i)
+        redundancy = np.maximum(redundancy, similarity[i])
+    return picked
+
+
+class MMRRetriever(BaseRetriever):
+    """
+    Retriever over a Chroma vectorstore that reranks a wide candidate set
+    in-process with mmr(), using the embeddings stored in the collection so
+    no chunk is embedded again.
+    """
+
+    vectorstore: Any
+    embeddings: Any
+    candidates: int = RETRIEVAL_CANDIDATES
+    top_n: int = RETRIEVAL_TOP_N
+    lambda_mult: float = RETRIEVAL_MMR_LAMBDA
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        return self._rerank(self.embeddings.embed_query(query))
+
+    async def _aget_relevant_documents(
+        self, query, *, run_manager=None
+    ) -> List[Document]:
+        query_embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self._rerank, query_embedding)
+
+    def _rerank(self, query_embedding):
+        results = self.vectorstore._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=max(self.candidates, self.top_n),
+            include=["documents", "metadatas", "embeddings"],
+        )
+        texts = results["documents"][0]
+        metadatas = results["metadatas"][0]
+        picked = mmr(
+            query_embedding, results["embeddings"][0], self.top_n, self.lambda_mult
+        )
+        return [
+            Document(page_content=texts[i], metadata=metadatas[i] or {})
+            for i in picked
+        ]
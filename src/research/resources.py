@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyResource:
+    """
+    Module-level stand-in for a registry resource. Attribute access, calls,
+    truth tests, `|` composition and isinstance() create the resource on
+    first use and are forwarded to it, so modules can keep importing names
+    like `rag_chain` or `vectorstore` without building them.
+
+    An identity test cannot be forwarded: `proxy is None` is always False.
+    Code handing the object to a library, or checking for a factory that
+    returned None, should take the real object from resolve().
+    """
+
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry, name):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def resolve(self):
+        """
+        Returns:
+            The resource itself, created now if this is its first use
+        """
+        return self._registry.get(self._name)
+
+    @property
+    def __class__(self):
+        return type(self.resolve())
+
+    def __getattr__(self, attribute):
+        return getattr(self.resolve(), attribute)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __bool__(self):
+        return bool(self.resolve())
+
+    def __or__(self, other):
+        return self.resolve() | resolve(other)
+
+    def __ror__(self, other):
+        return resolve(other) | self.resolve()
+
+    def __repr__(self):
+        return f"<lazy resource {self._name}>"
+
+
+def resolve(value):
+    """
+    The resource behind a LazyResource, any other value unchanged.
+    """
+    if type(value) is LazyResource:
+        return value.resolve()
+    return value
+
+
+class Resources:
+    """
+    Registry of the expensive shared objects: API clients, the Chroma store,
+    chains and tools. Each is created by its factory the first time it is
+    needed, once per process, and the creation time is recorded.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._values = {}
+        # Reentrant, factories get the resources they are built from
+        self._lock = threading.RLock()
+        self.timings = {}
+
+    def register(self, name, factory):
+        """
+        Args:
+            name (str): Name of the resource
+            factory: Zero-argument callable creating it
+
+        Returns:
+            LazyResource: Stand-in to export in place of the resource
+        """
+        self._factories[name] = factory
+        return LazyResource(self, name)
+
+    def get(self, name):
+        """
+        Returns:
+            The resource, created now if this is its first use
+        """
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._values:
+                start = time.perf_counter()
+                value = self._factories[name]()
+                self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+                self._values[name] = value
+                logger.info(
+                    "resource created",
+                    extra={"resource": name, "duration_ms": self.timings[name]},
+                )
+            return self._values[name]
+
+    def created(self, name):
+        return name in self._values
+
+    def warmup(self, names=None):
+        """
+        Create resources ahead of the first request.
+
+        Args:
+            names: Resources to create, all registered ones if None
+
+        Returns:
+            dict: Errors by resource name for the ones that failed
+        """
+        errors = {}
+        for name in names or list(self._factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(
+                    "resource creation failed",
+                    extra={"resource": name, "error": str(e)},
+                )
+                errors[name] = str(e)
+        return errors
+
+    def stats(self):
+        """
+        Returns:
+            dict: Resources registered and created, and the creation time of
+            each created one in milliseconds
+        """
+        return {
+            "registered": len(self._factories),
+            "created": len(self._values),
+            **{f"{name}_create_ms": ms for name, ms in self.timings.items()},
+        }
+
+
+resources = Resources()
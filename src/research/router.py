@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import threading
+
+import numpy as np
+
+from tools import embeddings, vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Decide between vectorstore and web search locally from the question's
+# similarity to the full-context chunks, only calling the LLM router when the
+# score falls between the two thresholds.
+LOCAL_ROUTER_ENABLED = os.environ.get("LOCAL_ROUTER_ENABLED", "false").lower() == "true"
+LOCAL_ROUTER_HIGH = float(os.environ.get("LOCAL_ROUTER_HIGH", "0.5"))
+LOCAL_ROUTER_LOW = float(os.environ.get("LOCAL_ROUTER_LOW", "0.25"))
+LOCAL_ROUTER_TOP_K = int(os.environ.get("LOCAL_ROUTER_TOP_K", "3"))
+
+
+class LocalRouter:
+    """
+    Embedding-similarity router over the full-context collection.
+
+    The question is scored by the mean cosine similarity of its top_k closest
+    chunks. At or above high it routes to the vectorstore, at or below low to
+    web search, and in between it returns None so the caller asks the LLM.
+    """
+
+    def __init__(self, vectorstore, embeddings, high, low, top_k=3):
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.high = high
+        self.low = low
+        self.top_k = top_k
+
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.stats = {"local_vectorstore": 0, "local_websearch": 0, "llm": 0}
+
+    def load(self):
+        """
+        Load and normalize the chunk embeddings of the collection.
+        """
+        with self._lock:
+            self._load()
+
+    def ensure_loaded(self):
+        """
+        Load the chunk embeddings unless they already are.
+        """
+        with self._lock:
+            if self._matrix is None:
+                self._load()
+
+    def _load(self):
+        records = self.vectorstore.get(include=["embeddings"])
+        matrix = np.asarray(records["embeddings"], dtype=np.float32)
+        if len(matrix):
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._matrix = matrix
+        logger.info("local router loaded", extra={"exemplars": len(matrix)})
+
+    def score(self, query_embedding):
+        """
+        Args:
+            query_embedding: Embedding of the question
+
+        Returns:
+            float: Mean cosine similarity of the top_k closest chunks
+        """
+        if self._matrix is None:
+            self.ensure_loaded()
+        if not len(self._matrix):
+            return 0.0
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self._matrix @ (query / np.linalg.norm(query))
+        k = min(self.top_k, len(similarities))
+        return float(np.partition(similarities, -k)[-k:].mean())
+
+    def decide(self, query_embedding):
+        """
+        Args:
+            query_embedding: Embedding of the question
+
+        Returns:
+            str: "vectorstore", "websearch", or None when the score is ambiguous
+        """
+        score = self.score(query_embedding)
+        logger.debug("local router score", extra={"score": round(score, 3)})
+        if score >= self.high:
+            self.stats["local_vectorstore"] += 1
+            return "vectorstore"
+        if score <= self.low:
+            self.stats["local_websearch"] += 1
+            return "websearch"
+        self.stats["llm"] += 1
+        return None
+
+    def route(self, question):
+        return self.decide(self.embeddings.embed_query(question))
+
+    async def aroute(self, question):
+        """
+        Async version of route. The first call reads the collection in a
+        worker thread instead of on the event loop.
+        """
+        if self._matrix is None:
+            await asyncio.to_thread(self.ensure_loaded)
+        return self.decide(await self.embeddings.aembed_query(question))
+
+
+local_router = LocalRouter(
+    vectorstore,
+    embeddings,
+    high=LOCAL_ROUTER_HIGH,
+    low=LOCAL_ROUTER_LOW,
+    top_k=LOCAL_ROUTER_TOP_K,
+)
@@ -4,9 +4,17 @@ from langgraph.graph import MessagesState
 
 class GraphState(MessagesState):
     question: str
+    datasource: str
+    intent: str
     generation: str
+    deadline: float
+    generations: int
+    max_generations: int
+    unverified: bool
     web_search: str
     documents: List[str]
+    packed_context: str
+    prefetched: Dict[str, Any]
     context: int
     user_data: Dict[str, Any]
     form_struct: Dict[str, Any]
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+# The app modules import each other flat, as when run from src/research
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+
+@pytest.fixture
+def offline_app(tmp_path, monkeypatch):
+    """
+    The graph module with the LLM, embeddings and web search replaced by the
+    bench fakes, and the stores seeded in a temporary working directory.
+    Resources created by the test are dropped afterwards.
+    """
+    import bench
+    import graph
+    from chromadb.api.client import SharedSystemClient
+    from embedding_cache import CachedEmbeddings
+    from metrics import instrument
+    from resources import resources
+    from utils import form_index
+
+    monkeypatch.chdir(tmp_path)
+    # Chroma keeps one client per persist path, and "vector" is relative
+    SharedSystemClient.clear_system_cache()
+    monkeypatch.setattr(resources, "_values", {})
+    monkeypatch.setattr(resources, "timings", {})
+    monkeypatch.setattr(form_index, "_vectorstore", None)
+    monkeypatch.setattr(form_index, "_loaded", False)
+    monkeypatch.setattr(graph, "ANSWER_CACHE_ENABLED", False)
+
+    no_latency = bench.Latency(0)
+    resources._values.update(
+        {
+            "llm": bench.FakeChatModel(latency=no_latency),
+            "embeddings": CachedEmbeddings(
+                bench.FakeEmbeddings(no_latency), model="fake", db_path=None
+            ),
+            "web_search_tool": instrument(
+                bench.FakeSearchTool(latency=no_latency), "web_search_tool"
+            ),
+        }
+    )
+    bench.seed_stores(chunks=20, forms=3)
+    return graph
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import nodes
+from bm25 import BM25Index, tokenize
+
+CHUNKS = [
+    "Performers have the exclusive right to record their performance.",
+    "Copyright societies collect royalties for their members.",
+    "Statutory licenses allow cover versions after a waiting period.",
+    "The Act protects literary, dramatic and musical works.",
+]
+
+
+class Vectorstore:
+    def __init__(self, documents):
+        self.documents = documents
+        self.threads = []
+
+    def get(self, include):
+        self.threads.append(threading.current_thread())
+        return {"documents": self.documents}
+
+
+class Document:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("What is the Right of a Performer?") == ["right", "performer"]
+
+
+def test_grade_accepts_rejects_and_defers():
+    index = BM25Index(Vectorstore(CHUNKS), high=0.35, low=0.05)
+    question = "exclusive right of performers to record"
+
+    assert index.grade(question, CHUNKS[0]) is True
+    assert index.grade(question, CHUNKS[1]) is False
+    assert index.grade("royalties for performers", CHUNKS[0]) is None
+    assert index.get_stats() == {
+        "accepted": 1,
+        "rejected": 1,
+        "uncertain": 1,
+        "grader_calls_avoided": 2,
+    }
+
+
+def test_async_pregrade_builds_the_index_off_the_event_loop(monkeypatch):
+    vectorstore = Vectorstore(CHUNKS)
+    monkeypatch.setattr(nodes, "PREGRADE_ENABLED", True)
+    monkeypatch.setattr(
+        nodes, "bm25_index", BM25Index(vectorstore, high=0.35, low=0.05)
+    )
+    documents = [Document(CHUNKS[0]), Document(CHUNKS[1])]
+
+    async def pregrade():
+        return await asyncio.gather(
+            *(nodes.apregrade("exclusive right to record", documents) for _ in range(3))
+        )
+
+    assert asyncio.run(pregrade()) == [[True, False]] * 3
+    assert len(vectorstore.threads) == 1
+    assert vectorstore.threads[0] is not threading.main_thread()
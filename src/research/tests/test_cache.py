@@ -0,0 +1,251 @@
+import asyncio
+import threading
+
+import pytest
+
+import cache as cache_module
+from cache import (
+    AnswerCache,
+    SingleFlight,
+    chroma_collection_version,
+    normalize_question,
+)
+
+
+class FakeEmbeddings:
+    """
+    Embeds the texts listed in vectors, and everything else as a vector
+    orthogonal to them.
+    """
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vectors.get(text, [0.0, 0.0, 1.0])
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+EMBEDDINGS = {
+    "what is fair use": [1.0, 0.0, 0.0],
+    "what is fair dealing": [0.99, 0.14, 0.0],
+    "fill the fair use form": [0.98, 0.2, 0.0],
+    "who owns a photograph": [0.0, 1.0, 0.0],
+}
+
+
+def make_cache(**kwargs):
+    return AnswerCache(FakeEmbeddings(EMBEDDINGS), **kwargs)
+
+
+def test_normalize_question():
+    assert normalize_question("  What is  Fair Use?? ") == "what is fair use"
+
+
+def test_exact_hit_skips_embedding():
+    cache = make_cache()
+    cache.put("What is fair use?", {"generation": "A defence."})
+
+    calls = cache.embeddings.calls
+    value, embedding = cache.lookup("what is fair use")
+
+    assert value == {"generation": "A defence."}
+    assert embedding is None
+    assert cache.embeddings.calls == calls
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_semantic_hit_and_miss():
+    cache = make_cache(similarity_threshold=0.95)
+    cache.put("what is fair use", {"generation": "A defence."})
+
+    value, _ = cache.lookup("what is fair dealing")
+    assert value == {"generation": "A defence."}
+
+    value, embedding = cache.lookup("who owns a photograph")
+    assert value is None
+    # Handed back so put() doesn't embed again
+    assert embedding is not None
+
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_confirm_similar_rejects_semantic_hit():
+    cache = make_cache(similarity_threshold=0.95)
+    cache.put("what is fair use", {"generation": "A defence."})
+
+    value, _ = cache.lookup("fill the fair use form", confirm_similar=lambda q: False)
+    assert value is None
+
+    async def command(question):
+        return False
+
+    value, _ = asyncio.run(
+        cache.alookup("fill the fair use form", confirm_similar=command)
+    )
+    assert value is None
+
+    # Exact hits are not vetted
+    value, _ = cache.lookup("what is fair use", confirm_similar=lambda q: False)
+    assert value is not None
+
+    stats = cache.stats()
+    assert stats["semantic_rejections"] == 2
+    assert stats["semantic_hits"] == 0
+    assert stats["misses"] == 2
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = make_cache(ttl_seconds=10)
+    cache.put("what is fair use", {"generation": "A defence."})
+
+    now[0] += 11
+    value, _ = cache.lookup("what is fair use")
+    assert value is None
+
+
+def test_evicts_least_recently_used():
+    cache = make_cache(max_entries=2, similarity_threshold=1.1)
+    cache.put("what is fair use", {"generation": "1"})
+    cache.put("who owns a photograph", {"generation": "2"})
+    cache.lookup("what is fair use")
+    cache.put("what is fair dealing", {"generation": "3"})
+
+    assert cache.lookup("what is fair use")[0] == {"generation": "1"}
+    assert cache.lookup("who owns a photograph")[0] is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_version_change_invalidates():
+    version = [1]
+    cache = make_cache(version_fn=lambda: version[0], version_check_interval=0)
+    cache.put("what is fair use", {"generation": "A defence."})
+    assert cache.lookup("what is fair use")[0] is not None
+
+    version[0] = 2
+    assert cache.lookup("what is fair use")[0] is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_async_version_check_runs_off_the_loop_and_the_lock():
+    calls = []
+
+    def version():
+        calls.append((threading.current_thread(), cache._lock.locked()))
+        return 1
+
+    cache = make_cache(version_fn=version, version_check_interval=60)
+
+    async def lookups():
+        await asyncio.gather(*(cache.alookup("what is fair use") for _ in range(3)))
+
+    asyncio.run(lookups())
+
+    # One check for the three lookups, in a worker thread, without the lock
+    assert calls == [(calls[0][0], False)]
+    assert calls[0][0] is not threading.main_thread()
+
+
+class Vectorstore:
+    def __init__(self, collection):
+        self._collection = collection
+
+
+def test_collection_version_ignores_other_collections():
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    chunks = client.get_or_create_collection("version-chunks")
+    forms = client.get_or_create_collection("version-forms")
+    chunks.add(ids=["a", "b"], embeddings=[[1.0, 0.0], [0.0, 1.0]])
+    vectorstore = Vectorstore(chunks)
+
+    version = chroma_collection_version(vectorstore, page_size=1)
+    forms.add(ids=["form"], embeddings=[[1.0, 1.0]])
+    assert chroma_collection_version(vectorstore, page_size=1) == version
+
+    # Same count, different chunks
+    chunks.delete(ids=["b"])
+    chunks.add(ids=["c"], embeddings=[[0.5, 0.5]])
+    changed = chroma_collection_version(vectorstore, page_size=1)
+    assert changed[0] == version[0] and changed != version
+    assert chroma_collection_version(None) is None
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    executions = []
+
+    async def work():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    async def scenario():
+        return await asyncio.gather(
+            *(single_flight.run("key", work) for _ in range(5)),
+            single_flight.run("other", work),
+        )
+
+    results = asyncio.run(scenario())
+
+    assert len(executions) == 2
+    assert [shared for _, shared in results[:5]].count(False) == 1
+    assert all(result == {"answer": 42} for result, _ in results)
+    assert single_flight.stats() == {
+        "executions": 2,
+        "saved_executions": 4,
+        "inflight": 0,
+    }
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    single_flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.ensure_future(single_flight.run("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.run("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+
+def test_single_flight_shares_errors_then_retries():
+    single_flight = SingleFlight()
+    attempts = []
+
+    async def work():
+        attempts.append(1)
+        await asyncio.sleep(0)
+        raise RuntimeError("backend down")
+
+    async def scenario():
+        return await asyncio.gather(
+            single_flight.run("key", work),
+            single_flight.run("key", work),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(attempts) == 1
+
+    # Nothing is left in flight, the next call runs again
+    with pytest.raises(RuntimeError):
+        asyncio.run(single_flight.run("key", work))
+    assert len(attempts) == 2
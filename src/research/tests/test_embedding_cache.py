@@ -0,0 +1,100 @@
+import asyncio
+
+from embedding_cache import CachedEmbeddings
+
+
+class FakeEmbeddings:
+    """
+    Embeds a text as [its length, 1 for documents or 2 for queries] and
+    records the size of every call.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append(1)
+        return [float(len(text)), 2.0]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def test_memory_tier_dedupes_and_separates_input_types():
+    underlying = FakeEmbeddings()
+    embeddings = CachedEmbeddings(underlying, "model", db_path=None)
+
+    assert embeddings.embed_documents(["a", "bb", "a"]) == [
+        [1.0, 1.0],
+        [2.0, 1.0],
+        [1.0, 1.0],
+    ]
+    assert embeddings.embed_documents(["bb"]) == [[2.0, 1.0]]
+    # Same text embedded as a query is a different entry
+    assert embeddings.embed_query("bb") == [2.0, 2.0]
+
+    assert underlying.calls == [2, 1]
+    stats = embeddings.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["api_calls"] == 2
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    CachedEmbeddings(FakeEmbeddings(), "model", db_path=path).embed_documents(["abc"])
+
+    underlying = FakeEmbeddings()
+    embeddings = CachedEmbeddings(underlying, "model", db_path=path)
+    assert asyncio.run(embeddings.aembed_documents(["abc"])) == [[3.0, 1.0]]
+    assert underlying.calls == []
+    assert embeddings.stats()["disk_hits"] == 1
+
+    # The model is part of the key
+    other = CachedEmbeddings(underlying, "other-model", db_path=path)
+    other.embed_documents(["abc"])
+    assert underlying.calls == [1]
+
+
+def test_memory_tier_is_bounded():
+    underlying = FakeEmbeddings()
+    embeddings = CachedEmbeddings(
+        underlying, "model", db_path=None, max_memory_entries=2
+    )
+    embeddings.embed_documents(["a", "bb", "ccc"])
+    embeddings.embed_documents(["a"])
+
+    assert embeddings.stats()["memory_entries"] == 2
+    assert underlying.calls == [3, 1]
+
+
+def test_misses_are_sent_in_batches():
+    underlying = FakeEmbeddings()
+    embeddings = CachedEmbeddings(underlying, "model", db_path=None, batch_size=4)
+
+    texts = [f"text {i}" for i in range(10)]
+    vectors = asyncio.run(embeddings.aembed_documents(texts))
+
+    assert vectors == [[float(len(text)), 1.0] for text in texts]
+    assert underlying.calls == [4, 4, 2]
+    assert embeddings.stats()["api_calls"] == 3
+
+
+def test_aembed_queries_batches_and_warms_the_cache():
+    underlying = FakeEmbeddings()
+    embeddings = CachedEmbeddings(underlying, "model", db_path=None, batch_size=3)
+
+    questions = ["q1", "q22", "q333", "q1"]
+    vectors = asyncio.run(embeddings.aembed_queries(questions))
+
+    assert vectors == [[2.0, 2.0], [3.0, 2.0], [4.0, 2.0], [2.0, 2.0]]
+    # Without a batch API the queries go one by one
+    assert underlying.calls == [1, 1, 1]
+    asyncio.run(embeddings.aembed_query("q22"))
+    assert underlying.calls == [1, 1, 1]
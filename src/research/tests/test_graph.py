@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import bench
+import nodes
+from tracing import end_trace, start_trace
+
+QUESTION = "What rights do performers get under the Copyright Act?"
+
+
+def parse_events(events):
+    parsed = []
+    for event in events:
+        kind, data = event.strip().split("\n")
+        parsed.append(
+            (kind.removeprefix("event: "), json.loads(data.removeprefix("data: ")))
+        )
+    return parsed
+
+
+def stream(graph, question=QUESTION):
+    async def collect():
+        return [event async for event in graph.stream_workflow(question, 0)]
+
+    return parse_events(asyncio.run(collect()))
+
+
+def test_stream_sends_generation_tokens(offline_app):
+    events = stream(offline_app)
+    kinds = [kind for kind, _ in events]
+    tokens = [data["content"] for kind, data in events if kind == "token"]
+    end = events[-1][1]
+
+    assert kinds[-1] == "end"
+    # One token event per streamed chunk, before the graders ran
+    assert len(tokens) == len(end["generation"].split(" "))
+    assert "".join(tokens) == end["generation"]
+    assert kinds.index("token") < kinds.index("end")
+    assert ("node", {"node": "generate", "status": "end"}) in events
+
+
+def test_stream_retracts_rejected_generation(offline_app, monkeypatch):
+    rejected = []
+
+    def reply(prompt):
+        if "supported by a set of facts" in prompt and not rejected:
+            rejected.append(prompt)
+            return json.dumps({"score": "no"})
+        return bench_reply(prompt)
+
+    bench_reply = bench.fake_reply
+    monkeypatch.setattr(bench, "fake_reply", reply)
+
+    events = stream(offline_app)
+    kinds = [kind for kind, _ in events]
+
+    assert ("retracted", {"reason": "not supported"}) in events
+    retracted = kinds.index("retracted")
+    before = [data["content"] for kind, data in events[:retracted] if kind == "token"]
+    after = [data["content"] for kind, data in events[retracted:] if kind == "token"]
+    # The rejected generation streamed before the retraction, the
+    # regenerated one after it
+    assert "".join(before) == events[-1][1]["generation"]
+    assert "".join(after) == events[-1][1]["generation"]
+
+
+def test_import_creates_no_resources(tmp_path):
+    # A fresh interpreter, other tests have already imported graph
+    script = (
+        "import sys, graph\n"
+        "from resources import resources\n"
+        "print(sorted(resources._values))\n"
+        "print(any(name.endswith('vectorstores.chroma') for name in sys.modules))"
+    )
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(bench.__file__)}
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", script],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.split() == ["[]", "False"]
+
+
+class Profiles:
+    async def get(self, user_id):
+        await asyncio.sleep(0)
+        return {"name": f"user {user_id}"}
+
+
+def traced_concurrently(graph, question, user_ids):
+    async def traced(user_id):
+        trace, token = start_trace()
+        try:
+            result = await graph.run_workflow(question, user_id)
+        finally:
+            end_trace(token)
+        return result, trace.to_dict()
+
+    async def run_all():
+        return await asyncio.gather(*(traced(user_id) for user_id in user_ids))
+
+    return asyncio.run(run_all())
+
+
+def test_coalesced_requests_are_annotated_in_their_trace(offline_app):
+    (_, leader), (_, follower) = traced_concurrently(offline_app, QUESTION, [1, 2])
+
+    assert "coalesced" not in leader["annotations"]
+    assert leader["node_runs"]["generate"] == 1
+    assert follower["annotations"] == {
+        "coalesced": True,
+        "leader_trace_id": leader["trace_id"],
+    }
+    assert [span["name"] for span in follower["spans"]] == ["wait"]
+
+
+def test_coalesced_command_times_its_own_user_steps(offline_app, monkeypatch):
+    monkeypatch.setattr(nodes, "profile_client", Profiles())
+    question = "Fill the copyright registration form"
+
+    (leader_result, _), (result, trace) = traced_concurrently(
+        offline_app, question, [1, 2]
+    )
+
+    assert leader_result["user_data"] == {"name": "user 1"}
+    assert result["user_data"] == {"name": "user 2"}
+    assert trace["annotations"]["coalesced"] is True
+    assert trace["node_runs"] == {
+        "get_form_struct": 1,
+        "user_data_sql": 1,
+        "merge_node": 1,
+    }
@@ -0,0 +1,38 @@
+import asyncio
+
+from metrics import chain_duration, completion_tokens, instrument, registry
+
+
+def observations(histogram, *labels):
+    state = histogram._values.get(labels)
+    return state[1] if state else 0
+
+
+def test_instrument_binds_no_callbacks():
+    from langchain_core.runnables import RunnableLambda
+
+    runnable = instrument(RunnableLambda(lambda x: x), "identity")
+
+    assert runnable.config == {"run_name": "identity", "tags": ["identity"]}
+
+
+def test_streamed_request_keeps_tokens_and_metrics(offline_app):
+    generations = observations(chain_duration, "rag_chain")
+    tokens = completion_tokens._values.get(("rag_chain",), 0)
+
+    async def collect():
+        return [
+            event
+            async for event in offline_app.stream_workflow(
+                "What rights do performers get under the Copyright Act?", 0
+            )
+        ]
+
+    events = asyncio.run(collect())
+
+    # The chains still report to astream_events...
+    assert any(event.startswith("event: token\n") for event in events)
+    # ...and to the metrics callback inherited from the graph run
+    assert observations(chain_duration, "rag_chain") == generations + 1
+    assert completion_tokens._values[("rag_chain",)] > tokens
+    assert 'chain_duration_seconds_count{chain="retriever"}' in registry.render()
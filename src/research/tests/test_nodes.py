@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import nodes
+from nodes import (
+    GENERATE_RESERVE_SECONDS,
+    agrade_documents_concurrently,
+    grade_documents_concurrently,
+)
+
+
+class Document:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+class Grader:
+    """
+    Stand-in for is_relevant/ais_relevant. A document's text is
+    "<relevant yes/no> <seconds to answer>", or "error" to raise. Records how
+    many calls ran at once and how many finished.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.finished = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def _exit(self):
+        with self._lock:
+            self.running -= 1
+            self.finished += 1
+
+    @staticmethod
+    def _parse(document):
+        if document.page_content == "error":
+            raise RuntimeError("grader unavailable")
+        relevant, seconds = document.page_content.split()
+        return relevant == "yes", float(seconds)
+
+    def __call__(self, question, document):
+        self._enter()
+        try:
+            relevant, seconds = self._parse(document)
+            self.release.wait(seconds)
+            return relevant
+        finally:
+            self._exit()
+
+    async def acall(self, question, document):
+        self._enter()
+        try:
+            relevant, seconds = self._parse(document)
+            await asyncio.sleep(seconds)
+            return relevant
+        finally:
+            self._exit()
+
+
+@pytest.fixture
+def grader(monkeypatch):
+    grader = Grader()
+    monkeypatch.setattr(nodes, "is_relevant", grader)
+    monkeypatch.setattr(nodes, "ais_relevant", grader.acall)
+    monkeypatch.setattr(nodes, "PREGRADE_ENABLED", False)
+    yield grader
+    grader.release.set()
+
+
+def grade(documents, asynchronous, **kwargs):
+    documents = [Document(text) for text in documents]
+    if asynchronous:
+        return asyncio.run(agrade_documents_concurrently("q", documents, **kwargs))
+    return grade_documents_concurrently("q", documents, **kwargs)
+
+
+both = pytest.mark.parametrize("asynchronous", [False, True], ids=["sync", "async"])
+
+
+@both
+def test_grades_keep_document_order(grader, asynchronous):
+    # Later documents finish first
+    documents = ["no 0.06", "yes 0.04", "no 0.02", "yes 0"]
+
+    grades = grade(documents, asynchronous, max_concurrency=4)
+
+    assert grades == [False, True, False, True]
+
+
+@both
+def test_concurrency_is_bounded(grader, asynchronous):
+    grades = grade(["yes 0.02"] * 6, asynchronous, max_concurrency=2)
+
+    assert grades == [True] * 6
+    assert grader.max_running == 2
+
+
+@both
+def test_one_at_a_time(grader, asynchronous):
+    grade(["yes 0.01"] * 3, asynchronous, max_concurrency=1)
+
+    assert grader.max_running == 1
+
+
+@both
+def test_short_circuit_stops_at_first_irrelevant_document(grader, asynchronous):
+    documents = ["no 0", "yes 0.5", "yes 0.5", "yes 0.5"]
+
+    grades = grade(documents, asynchronous, max_concurrency=1, short_circuit=True)
+
+    assert grades == [False, None, None, None]
+    if asynchronous:
+        # The running call is cancelled as well as the waiting ones
+        assert grader.finished == 2 and grader.running == 0
+    else:
+        # Calls not started yet are cancelled, the running one is dropped
+        assert grader.max_running == 1
+
+
+@both
+def test_failed_grader_call_keeps_the_document(grader, asynchronous):
+    grades = grade(["no 0", "error", "yes 0"], asynchronous)
+
+    assert grades == [False, True, True]
+
+
+@both
+def test_grades_missing_at_the_deadline_keep_their_documents(grader, asynchronous):
+    deadline = time.time() + GENERATE_RESERVE_SECONDS + 0.1
+    started = time.perf_counter()
+
+    grades = grade(["no 0", "yes 5", "no 5"], asynchronous, deadline=deadline)
+
+    assert grades == [False, True, True]
+    assert time.perf_counter() - started < 1
+
+
+def test_grade_documents_filters_and_flags_web_search(grader, monkeypatch):
+    monkeypatch.setattr(nodes, "GRADE_SHORT_CIRCUIT", False)
+    documents = [Document("yes 0"), Document("no 0"), Document("yes 0")]
+
+    update = asyncio.run(
+        nodes.agrade_documents({"question": "q", "documents": documents})
+    )
+
+    assert update["documents"] == [documents[0], documents[2]]
+    assert update["web_search"] == "Yes"
+    assert nodes.grade_documents({"question": "q", "documents": documents}) == update
@@ -0,0 +1,83 @@
+from packing import (
+    estimate_tokens,
+    fit_budget,
+    pack_context,
+    select_chunks,
+    split_text,
+    trim_overlap,
+)
+
+
+class Document:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+def test_split_text_respects_chunk_size():
+    text = "First sentence here. Second one follows.\n\n" + "word " * 60
+    chunks = split_text(text, 30)
+
+    assert chunks[0] == "First sentence here."
+    assert all(len(chunk) <= 30 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_select_chunks_ranks_dedupes_and_budgets():
+    chunks = ["closest", "near duplicate", "different", "too long " * 40]
+    embeddings = [[1.0, 0.0], [0.99, 0.01], [0.6, 0.8], [0.9, 0.1]]
+
+    picked = select_chunks([1.0, 0.0], embeddings, chunks, 20, 0.98)
+
+    assert picked == [0, 2]
+
+
+def test_fit_budget_keeps_leading_chunks():
+    chunks = ["a" * 40, "b" * 40, "c" * 4]
+    assert fit_budget(chunks, estimate_tokens(chunks[0]) + 5) == [chunks[0]]
+
+
+def test_trim_overlap_drops_contained_and_shared_runs():
+    kept = ["The Copyright Act, 1957 protects literary and dramatic works."]
+    assert trim_overlap(kept, "literary and dramatic works", 10, 200) == ""
+
+    tail = "protects literary and dramatic works."
+    trimmed = trim_overlap(kept, tail + " It also covers music.", 10, 200)
+    assert trimmed == "It also covers music."
+
+
+def test_pack_context_keeps_incoming_order():
+    documents = [
+        Document("Ranked first by the retriever."),
+        "Performer rights copyright question words stuffed in.",
+        Document("Ranked third."),
+    ]
+
+    context = pack_context(documents, "performer rights copyright", 1000)
+
+    assert context.split("\n\n") == [
+        "Ranked first by the retriever.",
+        "Performer rights copyright question words stuffed in.",
+        "Ranked third.",
+    ]
+
+
+def test_pack_context_drops_duplicates():
+    documents = [Document("Same chunk of text."), "chunk of text"]
+    assert pack_context(documents, "chunk", 1000) == "Same chunk of text."
+
+
+def test_pack_context_trims_what_does_not_fit():
+    first = "Background that the retriever ranked first. " * 4
+    second = (
+        "Unrelated filler sentence. Performer rights last fifty years. "
+        "More filler without the words."
+    )
+    budget = estimate_tokens(first.strip()) + 12
+
+    context = pack_context([first, second], "how long do performer rights last", budget)
+
+    assert context.split("\n\n") == [
+        first.strip(),
+        "Performer rights last fifty years.",
+    ]
+    assert estimate_tokens(context) <= budget + 1
@@ -0,0 +1,171 @@
+import asyncio
+
+import httpx
+
+import profile_client as profile_client_module
+from profile_client import ProfileClient
+
+
+class Backend:
+    """
+    Stand-in for the backend's profile endpoint, answering each request with
+    the next queued response for the user.
+    """
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.requests = []
+
+    def __call__(self, request):
+        user_id = request.url.path.rsplit("/", 1)[-1]
+        self.requests.append(user_id)
+        queued = self.responses.get(user_id)
+        if queued:
+            return queued.pop(0)
+        return httpx.Response(200, json={"user_id": user_id, "Name": f"user {user_id}"})
+
+
+def make_client(backend, **kwargs):
+    return ProfileClient(
+        base_url="http://backend.test",
+        retry_backoff=0,
+        transport=httpx.MockTransport(backend),
+        **kwargs,
+    )
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_fetches_and_caches_profile():
+    backend = Backend()
+    client = make_client(backend)
+
+    async def scenario():
+        first = await client.get(1)
+        second = await client.get(1)
+        await client.aclose()
+        return first, second
+
+    first, second = run(scenario())
+    assert first == {"user_id": "1", "Name": "user 1"}
+    assert second == first
+    assert backend.requests == ["1"]
+    assert client.stats()["hits"] == 1
+
+
+def test_retries_retryable_status_then_succeeds():
+    backend = Backend({"1": [httpx.Response(503), httpx.Response(429)]})
+    client = make_client(backend, retries=2)
+
+    profile = run(client.get(1))
+
+    assert profile["user_id"] == "1"
+    assert backend.requests == ["1", "1", "1"]
+    assert client.stats()["retries"] == 2
+
+
+def test_gives_up_after_retries():
+    backend = Backend({"1": [httpx.Response(503) for _ in range(3)]})
+    client = make_client(backend, retries=1)
+
+    profile = run(client.get(1))
+
+    assert profile["error"] is True
+    assert profile["status_code"] == 503
+    assert len(backend.requests) == 2
+    # Errors are not cached
+    assert run(client.get(1))["user_id"] == "1"
+
+
+def test_does_not_retry_client_errors():
+    backend = Backend({"1": [httpx.Response(404)]})
+    client = make_client(backend, retries=2)
+
+    profile = run(client.get(1))
+
+    assert profile["status_code"] == 404
+    assert backend.requests == ["1"]
+
+
+def test_retries_transport_errors():
+    calls = []
+
+    def flaky(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"Name": "ok"})
+
+    client = make_client(flaky, retries=1)
+
+    assert run(client.get(1)) == {"Name": "ok"}
+    assert len(calls) == 2
+
+
+def test_invalid_body_is_an_error():
+    backend = Backend(
+        {
+            "1": [httpx.Response(200, content=b"<html>")],
+            "2": [httpx.Response(200, json=["not", "a", "profile"])],
+        }
+    )
+    client = make_client(backend)
+
+    for user_id in (1, 2):
+        profile = run(client.get(user_id))
+        assert profile["error"] is True
+        assert profile["message"] == "Invalid user profile response"
+    assert client.stats()["cached"] == 0
+
+
+def test_cached_profile_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(profile_client_module.time, "monotonic", lambda: now[0])
+    backend = Backend()
+    client = make_client(backend, cache_ttl=10)
+
+    run(client.get(1))
+    now[0] += 5
+    run(client.get(1))
+    assert backend.requests == ["1"]
+
+    now[0] += 10
+    run(client.get(1))
+    assert backend.requests == ["1", "1"]
+
+
+def test_evicts_least_recently_used_profile():
+    backend = Backend()
+    client = make_client(backend, cache_max_entries=2)
+
+    async def scenario():
+        await client.get(1)
+        await client.get(2)
+        # 1 is now more recently used than 2
+        await client.get(1)
+        await client.get(3)
+        await client.get(1)
+        await client.get(2)
+
+    run(scenario())
+    assert backend.requests == ["1", "2", "3", "2"]
+
+
+def test_concurrent_lookups_share_one_request():
+    backend = Backend()
+    client = make_client(backend)
+
+    async def scenario():
+        return await asyncio.gather(*(client.get(7) for _ in range(5)))
+
+    profiles = run(scenario())
+    assert all(profile == profiles[0] for profile in profiles)
+    assert backend.requests == ["7"]
+
+
+def test_missing_base_url_is_an_error():
+    client = ProfileClient(base_url=None)
+
+    assert run(client.get(1))["error"] is True
@@ -0,0 +1,66 @@
+from rerank import MMRRetriever, mmr
+
+
+def test_pure_relevance_ranks_by_similarity():
+    embeddings = [[0.0, 1.0], [1.0, 0.0], [0.7, 0.7]]
+    assert mmr([1.0, 0.0], embeddings, 3, 1.0) == [1, 2, 0]
+
+
+def test_diversity_pushes_out_near_duplicates():
+    embeddings = [[1.0, 0.0], [0.99, 0.05], [0.6, 0.8]]
+
+    assert mmr([1.0, 0.0], embeddings, 2, 1.0) == [0, 1]
+    assert mmr([1.0, 0.0], embeddings, 2, 0.3) == [0, 2]
+
+
+def test_mmr_handles_small_candidate_sets():
+    assert mmr([1.0, 0.0], [], 4, 0.7) == []
+    assert mmr([1.0, 0.0], [[0.0, 2.0]], 4, 0.7) == [0]
+
+
+class FakeCollection:
+    def __init__(self, texts, embeddings):
+        self.texts = texts
+        self.embeddings = embeddings
+        self.n_results = None
+
+    def query(self, query_embeddings, n_results, include):
+        self.n_results = n_results
+        return {
+            "documents": [self.texts],
+            "metadatas": [[{"source": text} for text in self.texts]],
+            "embeddings": [self.embeddings],
+        }
+
+
+class FakeVectorstore:
+    def __init__(self, collection):
+        self._collection = collection
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+    async def aembed_query(self, text):
+        return [1.0, 0.0]
+
+
+def test_retriever_reranks_candidates():
+    collection = FakeCollection(
+        ["best", "copy of best", "other angle"],
+        [[1.0, 0.0], [0.99, 0.05], [0.6, 0.8]],
+    )
+    retriever = MMRRetriever(
+        vectorstore=FakeVectorstore(collection),
+        embeddings=FakeEmbeddings(),
+        candidates=3,
+        top_n=2,
+        lambda_mult=0.3,
+    )
+
+    documents = retriever.invoke("question")
+
+    assert [d.page_content for d in documents] == ["best", "other angle"]
+    assert documents[1].metadata == {"source": "other angle"}
+    assert collection.n_results == 3
@@ -0,0 +1,79 @@
+import pytest
+
+from resources import LazyResource, Resources, resolve
+
+
+class Client:
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, value):
+        return f"{self.name}({value})"
+
+    def __or__(self, other):
+        return f"{self.name} | {other}"
+
+
+def test_resources_are_created_once_on_first_use():
+    resources = Resources()
+    created = []
+
+    def make():
+        created.append(1)
+        return Client("llm")
+
+    llm = resources.register("llm", make)
+    assert created == []
+    assert not resources.created("llm")
+
+    assert llm.name == "llm"
+    assert llm.name == "llm"
+    assert created == [1]
+    assert resources.stats()["created"] == 1
+    assert "llm_create_ms" in resources.stats()
+
+
+def test_proxy_forwards_calls_composition_and_type_checks():
+    resources = Resources()
+    llm = resources.register("llm", lambda: Client("llm"))
+
+    assert llm("x") == "llm(x)"
+    assert llm | "parser" == "llm | parser"
+    assert isinstance(llm, Client)
+    assert type(resolve(llm)) is Client
+    assert resolve("not a proxy") == "not a proxy"
+
+
+def test_factories_can_use_other_resources():
+    resources = Resources()
+    resources.register("embeddings", lambda: Client("embeddings"))
+    store = resources.register(
+        "store", lambda: Client(f"store over {resources.get('embeddings').name}")
+    )
+
+    assert store.name == "store over embeddings"
+    assert resources.created("embeddings")
+
+
+def test_missing_resource_is_falsy_but_not_none():
+    resources = Resources()
+    vectorstore = resources.register("vectorstore", lambda: None)
+
+    assert isinstance(vectorstore, LazyResource)
+    assert not vectorstore
+    assert resolve(vectorstore) is None
+
+
+def test_warmup_reports_failures():
+    resources = Resources()
+    resources.register("ok", lambda: Client("ok"))
+
+    def broken():
+        raise RuntimeError("no API key")
+
+    resources.register("broken", broken)
+
+    assert resources.warmup() == {"broken": "no API key"}
+    assert resources.created("ok")
+    with pytest.raises(RuntimeError):
+        resources.get("broken")
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+from router import LocalRouter
+
+
+class Vectorstore:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.threads = []
+
+    def get(self, include):
+        self.threads.append(threading.current_thread())
+        return {"embeddings": self.embeddings}
+
+
+class Embeddings:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+    async def aembed_query(self, text):
+        return self.vectors[text]
+
+
+def make_router(vectorstore):
+    embeddings = Embeddings(
+        {"on topic": [1.0, 0.0], "off topic": [0.0, 1.0], "unsure": [0.6, 0.8]}
+    )
+    return LocalRouter(vectorstore, embeddings, high=0.9, low=0.3, top_k=2)
+
+
+def test_routes_by_similarity_to_the_chunks():
+    router = make_router(Vectorstore([[1.0, 0.0], [0.98, 0.2], [0.9, 0.1]]))
+
+    assert router.route("on topic") == "vectorstore"
+    assert router.route("off topic") == "websearch"
+    assert router.route("unsure") is None
+    assert router.stats == {"local_vectorstore": 1, "local_websearch": 1, "llm": 1}
+
+
+def test_async_route_loads_off_the_event_loop_once():
+    vectorstore = Vectorstore([[1.0, 0.0], [0.98, 0.2]])
+    router = make_router(vectorstore)
+
+    async def route():
+        return await asyncio.gather(*(router.aroute("on topic") for _ in range(3)))
+
+    assert asyncio.run(route()) == ["vectorstore"] * 3
+    assert len(vectorstore.threads) == 1
+    assert vectorstore.threads[0] is not threading.main_thread()
+
+
+def test_empty_collection_routes_to_web_search():
+    router = make_router(Vectorstore([]))
+
+    assert router.route("on topic") == "websearch"
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import utils
+from utils import LegacyFormRecords, form_index, upsert_forms
+
+
+def form(form_id, title="Copyright registration form"):
+    data = {
+        "formId": form_id,
+        "title": title,
+        "description": f"Register a copyrighted work, {form_id}",
+        "fields": [{"label": "Name"}, {"label": "Email"}],
+    }
+    return {"data": {**data, "data": data}}
+
+
+def add_legacy_records(collection, json_data):
+    """
+    Store a form the way store_form_data did before upsert_forms.
+    """
+    form_id = json_data["data"]["formId"]
+    metadata = {"full_data": json.dumps(json_data)}
+    collection.add(
+        ids=[f"legacy-{form_id}-title", f"legacy-{form_id}-description"],
+        embeddings=[[1.0] * 1024, [0.5] * 1024],
+        documents=[json_data["data"]["title"], json_data["data"]["description"]],
+        metadatas=[{**metadata, "source": "title"}, {**metadata, "source": "desc"}],
+    )
+
+
+@pytest.fixture
+def legacy_records(offline_app, monkeypatch):
+    records = LegacyFormRecords(page_size=2)
+    monkeypatch.setattr(utils, "legacy_form_records", records)
+    return records
+
+
+def test_upsert_deletes_legacy_records_without_loading_the_index(
+    legacy_records, monkeypatch
+):
+    collection = form_index.get_vectorstore()._collection
+    add_legacy_records(collection, form("bench-0"))
+    add_legacy_records(collection, form("old-only"))
+
+    scans = []
+    scan = legacy_records._scan
+    monkeypatch.setattr(legacy_records, "_scan", lambda c: scans.append(1) or scan(c))
+
+    def load():
+        raise AssertionError("the write path must not load the form index")
+
+    monkeypatch.setattr(form_index, "load", load)
+
+    stats = upsert_forms([form("bench-0", title="Renamed form")])
+    upsert_forms([form("new-form")])
+
+    assert stats["upserted"] == 1
+    assert len(scans) == 1
+    ids = set(collection.get(include=[])["ids"])
+    assert not {"legacy-bench-0-title", "legacy-bench-0-description"} & ids
+    assert {"legacy-old-only-title", "legacy-old-only-description"} <= ids
+    assert legacy_records.ids(collection, ["bench-0", "old-only"]) == [
+        "legacy-old-only-title",
+        "legacy-old-only-description",
+    ]
+
+
+def test_index_prefers_upserted_records_over_legacy_ones(offline_app):
+    collection = form_index.get_vectorstore()._collection
+    add_legacy_records(collection, form("bench-1", title="Outdated title"))
+    add_legacy_records(collection, form("old-only", title="Old form"))
+
+    form_index.load()
+
+    assert form_index.forms["old-only"]["data"]["title"] == "Old form"
+    assert form_index.forms["bench-1"]["data"]["title"] != "Outdated title"
+
+
+def test_async_lookup_loads_the_index_off_the_event_loop(offline_app, monkeypatch):
+    threads = []
+    load = form_index._load
+    monkeypatch.setattr(
+        form_index,
+        "_load",
+        lambda: threads.append(threading.current_thread()) or load(),
+    )
+    form_index.invalidate()
+
+    async def lookup():
+        return await asyncio.gather(
+            *(utils.aget_form_struct_data("copyright registration") for _ in range(3))
+        )
+
+    results = asyncio.run(lookup())
+
+    assert len({result["formId"] for result in results}) == 1
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
@@ -1,24 +1,58 @@
-from groq import BaseModel, Groq
-from langchain_groq import ChatGroq
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.vectorstores import Chroma
-from langchain_cohere import CohereEmbeddings
 
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from pydantic import SecretStr
-import os
-from langchain_community.tools.tavily_search import TavilySearchResults
 from dotenv import load_dotenv
+import logging
 
-load_dotenv()
-embeddings = CohereEmbeddings(
-    model="embed-english-v3.0", client=None, async_client=None
+from cassette import (
+    CACHES_ENABLED,
+    with_cassette_embeddings,
+    with_cassette_llm,
+    with_cassette_search,
+)
+from embedding_cache import (
+    EMBEDDING_CACHE_MEMORY_ENTRIES,
+    EMBEDDING_CACHE_PATH,
+    CachedEmbeddings,
 )
+from metrics import instrument
+from rerank import MMRRetriever
+from resources import resources
+
+load_dotenv()
+logger = logging.getLogger(__name__)
 groq_api_key = os.environ.get("GROQ_API_KEY")
 
+# Clients, the vectorstore, chains and tools are created on first use through
+# the resources registry. Importing this module only declares them; the server
+# creates them all at startup (see graph.warmup).
+
+
+def create_embeddings():
+    """
+    The Cohere embeddings client behind the embedding cache, shared by the
+    retriever, the routers and the form index. The cache is off while a
+    cassette records or replays.
+    """
+    from langchain_cohere import CohereEmbeddings
+
+    return CachedEmbeddings(
+        with_cassette_embeddings(
+            lambda: CohereEmbeddings(
+                model="embed-english-v3.0", client=None, async_client=None
+            ),
+            model="embed-english-v3.0",
+        ),
+        model="embed-english-v3.0",
+        db_path=EMBEDDING_CACHE_PATH if CACHES_ENABLED else None,
+        max_memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES if CACHES_ENABLED else 0,
+    )
+
+
+embeddings = resources.register("embeddings", create_embeddings)
+
 
 def load_vectorstore_from_disk(persist_directory="vector"):
     """
@@ -30,32 +64,61 @@ def load_vectorstore_from_disk(persist_directory="vector"):
     Returns:
         Chroma vectorstore object
     """
+    from langchain_community.vectorstores import Chroma
+
     try:
         vectorstore = Chroma(
             persist_directory=persist_directory,
-            embedding_function=embeddings,
+            embedding_function=resources.get("embeddings"),
             collection_name="full-context",
         )
         return vectorstore
     except Exception as e:
-        print(f"Error loading vectorstore: {e}")
+        logger.error("error loading vectorstore", extra={"error": str(e)})
         return None
 
 
-vectorstore = load_vectorstore_from_disk()
+vectorstore = resources.register("vectorstore", load_vectorstore_from_disk)
 
-if vectorstore is not None:
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 7})
-else:
-    print("Failed to load vectorstore, retriever not initialized")
-    retriever = None
 
+def create_retriever():
+    vectorstore = resources.get("vectorstore")
+    if vectorstore is None:
+        logger.error("failed to load vectorstore, retriever not initialized")
+        return None
+    return instrument(
+        MMRRetriever(vectorstore=vectorstore, embeddings=resources.get("embeddings")),
+        "retriever",
+    )
+
+
+retriever = resources.register("retriever", create_retriever)
+
+
+def create_llm():
+    from langchain_groq import ChatGroq
+
+    return with_cassette_llm(
+        lambda: ChatGroq(
+            temperature=0,
+            model="llama3-70b-8192",
+            api_key=SecretStr(groq_api_key) if groq_api_key else None,
+        ),
+        model="llama3-70b-8192",
+    )
+
+
+llm = resources.register("llm", create_llm)
+
+
+def register_chain(name, prompt, parser):
+    """
+    Register an instrumented prompt | llm | parser chain, compiled on first use.
+    """
+    return resources.register(
+        name, lambda: instrument(prompt | resources.get("llm") | parser, name)
+    )
 
-llm = ChatGroq(
-    temperature=0,
-    model="llama3-70b-8192",
-    api_key=SecretStr(groq_api_key) if groq_api_key else None,
-)
 
 prompt_question = PromptTemplate(
     template="""<|begin_of_text|><|start_header_id|>system<|end_header_id|> You are an expert at routing a 
@@ -70,7 +133,7 @@ prompt_question = PromptTemplate(
     input_variables=["question"],
 )
 
-question_router = prompt_question | llm | JsonOutputParser()
+question_router = register_chain("question_router", prompt_question, JsonOutputParser())
 prompt = PromptTemplate(
     template="""<|begin_of_text|><|start_header_id|>system<|end_header_id|> You are an assistant for question-answering tasks. 
     Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. 
@@ -88,7 +151,11 @@ def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
 
-rag_chain = prompt | llm | StrOutputParser()
+# Tagged "rag_chain" by instrument(), /query/stream picks its tokens out of the
+# graph's event stream by that tag. The chain must keep the callbacks it
+# inherits from the graph run for its tokens to reach that stream, see
+# tests/test_graph.py.
+rag_chain = register_chain("rag_chain", prompt, StrOutputParser())
 
 prompt = PromptTemplate(
     template="""<|begin_of_text|><|start_header_id|>system<|end_header_id|> You are a grader assessing relevance 
@@ -103,7 +170,7 @@ prompt = PromptTemplate(
     input_variables=["question", "document"],
 )
 
-retrieval_grader = prompt | llm | JsonOutputParser()
+retrieval_grader = register_chain("retrieval_grader", prompt, JsonOutputParser())
 
 prompt = PromptTemplate(
     template=""" <|begin_of_text|><|start_header_id|>system<|end_header_id|> You are a grader assessing whether 
@@ -118,7 +185,9 @@ prompt = PromptTemplate(
     input_variables=["generation", "documents"],
 )
 
-hallucination_grader = prompt | llm | JsonOutputParser()
+hallucination_grader = register_chain(
+    "hallucination_grader", prompt, JsonOutputParser()
+)
 
 prompt = PromptTemplate(
     template="""<|begin_of_text|><|start_header_id|>system<|end_header_id|> You are a grader assessing whether an 
@@ -131,7 +200,24 @@ prompt = PromptTemplate(
     Here is the question: {question} <|eot_id|><|start_header_id|>assistant<|end_header_id|>""",
     input_variables=["generation", "question"],
 )
-answer_grader = prompt | llm | JsonOutputParser()
+answer_grader = register_chain("answer_grader", prompt, JsonOutputParser())
+
+prompt = PromptTemplate(
+    template="""<|begin_of_text|><|start_header_id|>system<|end_header_id|> You are a grader assessing an answer 
+    to a question against a set of facts. First decide whether the answer is grounded in / supported by the facts. 
+    Then decide whether the answer is useful to resolve the question. Give a binary 'yes' or 'no' for each. 
+    Provide the scores as a JSON with the keys 'grounded' and 'useful' and no preamble or explanation.
+     <|eot_id|><|start_header_id|>user<|end_header_id|>
+    Here are the facts:
+    \n ------- \n
+    {documents} 
+    \n ------- \n
+    Here is the answer: {generation}
+    Here is the question: {question} <|eot_id|><|start_header_id|>assistant<|end_header_id|>""",
+    input_variables=["generation", "documents", "question"],
+)
+# Single-call replacement for hallucination_grader followed by answer_grader
+combined_grader = register_chain("combined_grader", prompt, JsonOutputParser())
 from langchain_core.pydantic_v1 import BaseModel, Field
 
 
@@ -154,5 +240,19 @@ prompt_intent = PromptTemplate(
     input_variables=["question"],
 )
 
-intent_classifier = prompt_intent | llm | JsonOutputParser(pydantic_object=IntentOutput)
-web_search_tool = TavilySearchResults(k=3)
+intent_classifier = register_chain(
+    "intent_classifier",
+    prompt_intent,
+    JsonOutputParser(pydantic_object=IntentOutput),
+)
+
+
+def create_web_search_tool():
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    return instrument(
+        with_cassette_search(lambda: TavilySearchResults(k=3)), "web_search_tool"
+    )
+
+
+web_search_tool = resources.register("web_search_tool", create_web_search_tool)
@@ -0,0 +1,124 @@
+import time
+import uuid
+from contextvars import ContextVar
+
+# The trace of the request being served, None unless the request opted in
+_current_trace = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Ordered timeline of one request: graph nodes visited and the LLM,
+    retriever, search and embedding calls they made, with start and end
+    offsets from the start of the request.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.started_at = time.perf_counter()
+        self.spans = []
+        self.annotations = {}
+
+    def add(self, kind, name, start, end):
+        self.spans.append(
+            {
+                "kind": kind,
+                "name": name,
+                "start_ms": round((start - self.started_at) * 1000, 1),
+                "end_ms": round((end - self.started_at) * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1),
+            }
+        )
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: trace_id, total_ms, spans sorted by start time, how many
+            times each node ran (the generate/websearch loop shows up here)
+            and the annotations added by the nodes
+        """
+        spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        node_runs = {}
+        for span in spans:
+            if span["kind"] == "node":
+                node_runs[span["name"]] = node_runs.get(span["name"], 0) + 1
+        return {
+            "trace_id": self.id,
+            "total_ms": round((time.perf_counter() - self.started_at) * 1000, 1),
+            "spans": spans,
+            "node_runs": node_runs,
+            "annotations": self.annotations,
+        }
+
+    def server_timing(self):
+        """
+        Returns:
+            str: Server-Timing header value with the total time per node and
+            per call, and how many times each ran
+        """
+        totals = {}
+        for span in self.spans:
+            key = (span["kind"], span["name"])
+            duration, count = totals.get(key, (0.0, 0))
+            totals[key] = (duration + span["duration_ms"], count + 1)
+        entries = [
+            f'{kind}-{name};dur={duration:.1f};desc="{count}x"'
+            for (kind, name), (duration, count) in totals.items()
+        ]
+        total_ms = (time.perf_counter() - self.started_at) * 1000
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(entries)
+
+
+def start_trace():
+    """
+    Start tracing the current request context.
+
+    Returns:
+        tuple: (RequestTrace, token to pass to end_trace)
+    """
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace_id():
+    """
+    Returns:
+        str: Id of the current request's trace, None if it isn't traced
+    """
+    trace = _current_trace.get()
+    return trace.id if trace is not None else None
+
+
+def record(kind, name, start, end):
+    """
+    Add a span to the current request's trace, if it is being traced.
+
+    Args:
+        kind (str): "node", "llm", "retriever", "search", "embedding" or
+            "single_flight"
+        name (str): Node or call name
+        start (float): time.perf_counter() at the start
+        end (float): time.perf_counter() at the end
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(kind, name, start, end)
+
+
+def annotate(name, value):
+    """
+    Attach a per-request fact to the current request's trace, if it is being
+    traced, e.g. which speculative fetches were used.
+
+    Args:
+        name (str): Annotation name
+        value: JSON-serializable value
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.annotations[name] = value
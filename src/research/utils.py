@@ -1,12 +1,15 @@
 import requests
-from langchain_community.vectorstores import Chroma
-from langchain_cohere import CohereEmbeddings
-from langchain_core.documents import Document
+import asyncio
+import hashlib
 import json
+import logging
 import os
+import threading
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 
 def flatten_form_data(json_response):
@@ -41,15 +44,11 @@ def flatten_form_data(json_response):
     return flattened_data
 
 
-from langchain_community.vectorstores import Chroma
-from langchain_cohere import CohereEmbeddings
-from langchain_core.documents import Document
-import json
+from resources import resolve
+from tools import embeddings
 
-# Initialize embedding model and vector store
-embedding_model = CohereEmbeddings(
-    model="embed-english-v3.0", client=None, async_client=None
-)
+# The form index shares the retriever's embeddings client and cache
+embedding_model = embeddings
 
 
 def store_form_data(json_data):
@@ -62,66 +61,347 @@ def store_form_data(json_data):
     Returns:
         str: Status message
     """
-    # Extract title and description for embedding
-    title = json_data["data"]["title"]
-    description = json_data["data"]["description"]
-
-    # Create Document objects
-    documents = [
-        Document(
-            page_content=title,
-            metadata={"source": "title", "full_data": json.dumps(json_data)},
-        ),
-        Document(
-            page_content=description,
-            metadata={"source": "description", "full_data": json.dumps(json_data)},
-        ),
-    ]
-
-    # Add to vector store
-    vectorstore = Chroma.from_documents(
-        documents=documents,
-        embedding=embedding_model,
-        collection_name="form-struct-data",
-        persist_directory="vector",
-    )
-    vectorstore.persist()
+    upsert_forms([json_data])
 
     return "Form data stored successfully in vector database"
 
 
-def query_form_data(query_text, n_results=1):
+def form_content_hash(json_data):
     """
-    Query the vector database for similar form data
+    Stable hash of a form's JSON, used to skip forms that haven't changed.
 
     Args:
-        query_text: The query text to search for
-        n_results: Number of results to return
+        json_data: JSON data containing form structure
+
+    Returns:
+        str: Hex digest of the form content
+    """
+    content = json.dumps(json_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def upsert_forms(forms):
+    """
+    Upsert a batch of forms into the form-struct-data collection.
+
+    Each form gets a title and a description record with IDs built from its
+    formId and content hash, so forms that are already stored unchanged are
+    skipped and stale records of changed forms are deleted, along with any
+    records stored for the same forms before upsert_forms. The full form JSON
+    is stored once, on the title record. Titles and descriptions of the whole
+    batch are embedded in one embed_documents call.
+
+    Args:
+        forms: Iterable of JSON form data
 
     Returns:
-        list: Retrieved form data
+        dict: Counts of forms seen, skipped, upserted and texts embedded
+    """
+    # Last occurrence of a formId wins
+    latest = {}
+    for json_data in forms:
+        latest[str(json_data["data"]["formId"])] = json_data
+    stats = {"forms": len(latest), "skipped": 0, "upserted": 0, "embedded": 0}
+    if not latest:
+        return stats
+
+    collection = form_index.get_vectorstore()._collection
+    existing = collection.get(where={"form_id": {"$in": list(latest)}}, include=[])
+    existing_ids = set(existing["ids"])
+
+    ids, texts, metadatas = [], [], []
+    legacy_ids = legacy_form_records.ids(collection, latest)
+    stale_ids = list(legacy_ids)
+    for form_id, json_data in latest.items():
+        content_hash = form_content_hash(json_data)
+        title_id = f"{form_id}:{content_hash}:title"
+        description_id = f"{form_id}:{content_hash}:description"
+        if title_id in existing_ids and description_id in existing_ids:
+            stats["skipped"] += 1
+            continue
+        stale_ids += [
+            i
+            for i in existing_ids
+            if i.startswith(f"{form_id}:") and i not in (title_id, description_id)
+        ]
+        base = {"form_id": form_id, "content_hash": content_hash}
+        ids += [title_id, description_id]
+        texts += [json_data["data"]["title"], json_data["data"]["description"]]
+        metadatas += [
+            {**base, "source": "title", "full_data": json.dumps(json_data)},
+            {**base, "source": "description"},
+        ]
+        stats["upserted"] += 1
+
+    if ids:
+        vectors = embedding_model.embed_documents(texts)
+        collection.upsert(
+            ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas
+        )
+        stats["embedded"] = len(texts)
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+        legacy_form_records.discard(legacy_ids)
+    if ids or stale_ids:
+        form_index.invalidate()
+    return stats
+
+
+class LegacyFormRecords:
+    """
+    IDs of the form-struct-data records stored before upsert_forms, by formId.
+
+    Legacy records carry the full form JSON but neither form_id nor
+    content_hash metadata, so Chroma can't select them by form. Their
+    metadata is scanned once, a page at a time and without the embeddings,
+    the first time upsert_forms asks for them. upsert_forms never writes
+    legacy records, so from then on the map only loses the ones it deletes.
+    """
+
+    def __init__(self, page_size=1000):
+        self.page_size = page_size
+        self._ids = None
+        self._lock = threading.Lock()
+
+    def ids(self, collection, form_ids):
+        """
+        Args:
+            collection: The form-struct-data Chroma collection
+            form_ids: formIds about to be upserted
+
+        Returns:
+            list: IDs of the legacy records of these forms
+        """
+        with self._lock:
+            if self._ids is None:
+                self._ids = self._scan(collection)
+            return [i for form_id in form_ids for i in self._ids.get(form_id, [])]
+
+    def discard(self, record_ids):
+        """
+        Forget records once they are deleted.
+        """
+        record_ids = set(record_ids)
+        with self._lock:
+            for form_id in list(self._ids or {}):
+                remaining = [i for i in self._ids[form_id] if i not in record_ids]
+                if remaining:
+                    self._ids[form_id] = remaining
+                else:
+                    del self._ids[form_id]
+
+    def _scan(self, collection):
+        legacy_ids = {}
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["metadatas"], limit=self.page_size, offset=offset
+            )
+            for record_id, metadata in zip(page["ids"], page["metadatas"]):
+                if "content_hash" in metadata or "full_data" not in metadata:
+                    continue
+                try:
+                    form_id = str(json.loads(metadata["full_data"])["data"]["formId"])
+                except Exception as e:
+                    logger.warning(
+                        "skipping unreadable form record", extra={"error": str(e)}
+                    )
+                    continue
+                legacy_ids.setdefault(form_id, []).append(record_id)
+            if len(page["ids"]) < self.page_size:
+                break
+            offset += self.page_size
+        logger.info("legacy form records scanned", extra={"forms": len(legacy_ids)})
+        return legacy_ids
+
+
+legacy_form_records = LegacyFormRecords()
+
+
+class FormIndex:
+    """
+    In-memory index over the form-struct-data collection.
+
+    The collection is read once, with the stored embeddings, and the parsed form
+    JSON is kept keyed by formId together with its flattened structure. Lookups
+    only embed the query and take a dot product against the in-memory matrix.
+    The index reloads itself on the next lookup after invalidate().
     """
-    # Initialize the vector store
-    vectorstore = Chroma(
-        embedding_function=embedding_model,
+
+    def __init__(
+        self,
+        embeddings,
         collection_name="form-struct-data",
         persist_directory="vector",
-    )
+    ):
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+
+        self.forms = {}
+        self._flattened = {}
+        self._matrix = None
+        self._row_form_ids = []
+        self._vectorstore = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get_vectorstore(self):
+        """
+        The long-lived Chroma client for the form collection.
+        """
+        if self._vectorstore is None:
+            from langchain_community.vectorstores import Chroma
+
+            self._vectorstore = Chroma(
+                embedding_function=resolve(self.embeddings),
+                collection_name=self.collection_name,
+                persist_directory=self.persist_directory,
+            )
+        return self._vectorstore
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def load(self):
+        """
+        (Re)load every form and its embeddings from the collection.
+        """
+        with self._lock:
+            self._load()
+
+    def ensure_loaded(self):
+        """
+        Load the index unless it already is.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+    def _load(self):
+        records = self.get_vectorstore().get(include=["embeddings", "metadatas"])
+
+        # The full JSON is stored once per form, other records only carry
+        # the form_id. Legacy records, from before upsert_forms, carry the
+        # full JSON and no content_hash; they only count for forms that
+        # upsert_forms hasn't written since.
+        current, legacy = {}, {}
+        record_form_ids = []
+        for metadata in records["metadatas"]:
+            form_id = metadata.get("form_id")
+            is_legacy = "content_hash" not in metadata
+            if "full_data" in metadata:
+                try:
+                    full_data = json.loads(metadata["full_data"])
+                    form_id = str(full_data["data"]["formId"])
+                    (legacy if is_legacy else current)[form_id] = full_data
+                except Exception as e:
+                    logger.warning(
+                        "skipping unreadable form record", extra={"error": str(e)}
+                    )
+            record_form_ids.append((form_id, is_legacy))
+        forms = {**legacy, **current}
+
+        row_form_ids = []
+        vectors = []
+        for (form_id, is_legacy), vector in zip(record_form_ids, records["embeddings"]):
+            if form_id in forms and not (is_legacy and form_id in current):
+                row_form_ids.append(form_id)
+                vectors.append(vector)
+
+        matrix = None
+        if vectors:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+        self.forms = forms
+        self._flattened = {}
+        self._matrix = matrix
+        self._row_form_ids = row_form_ids
+        self._loaded = True
+        logger.info("form index loaded", extra={"forms": len(forms)})
+
+    def invalidate(self):
+        """
+        Mark the index stale so the next lookup reloads it.
+        """
+        self._loaded = False
+
+    def search(self, query_embedding, n_results=1):
+        """
+        Find the forms closest to a query embedding.
+
+        Args:
+            query_embedding: Embedding of the query text
+            n_results: Number of forms to return
+
+        Returns:
+            list: formIds, best match first
+        """
+        if not self._loaded:
+            self.ensure_loaded()
+        matrix, row_form_ids = self._matrix, self._row_form_ids
+        if matrix is None:
+            return []
+
+        scores = matrix @ np.asarray(query_embedding, dtype=np.float32)
+        form_ids = []
+        for i in np.argsort(-scores):
+            # Title and description rows point at the same form
+            if row_form_ids[i] not in form_ids:
+                form_ids.append(row_form_ids[i])
+                if len(form_ids) == n_results:
+                    break
+        return form_ids
+
+    def flattened(self, form_id):
+        """
+        Flattened structure of a form, see flatten_form_data.
+
+        Args:
+            form_id: The formId to flatten
+
+        Returns:
+            dict: A copy of the cached flattened form
+        """
+        if form_id not in self._flattened:
+            self._flattened[form_id] = flatten_form_data({"data": self.forms[form_id]})
+        return dict(self._flattened[form_id])
+
+
+form_index = FormIndex(embedding_model)
+
+
+def get_form_struct_data(query_text):
+    """
+    Flattened structure of the form that best matches the query text
+
+    Args:
+        query_text: The query text to search for
 
-    # Search the vector store
-    results = vectorstore.similarity_search(query_text, k=n_results)
+    Returns:
+        dict: Flattened form data structure
+    """
+    form_ids = form_index.search(embedding_model.embed_query(query_text))
+    if not form_ids:
+        raise ValueError("No forms found in the form-struct-data collection")
+    return form_index.flattened(form_ids[0])
 
-    # Extract and return the JSON data
-    retrieved_data = []
-    for doc in results:
-        try:
-            # Parse the JSON from metadata
-            full_data = json.loads(doc.metadata["full_data"])
-            retrieved_data.append({"data": full_data})
-        except Exception as e:
-            retrieved_data.append({"error": str(e), "content": doc.page_content})
 
-    return retrieved_data
+async def aget_form_struct_data(query_text):
+    """
+    Async version of get_form_struct_data. The first lookup, and any after
+    invalidate(), reads the collection in a worker thread instead of on the
+    event loop.
+    """
+    query_embedding = await embedding_model.aembed_query(query_text)
+    if not form_index.loaded:
+        await asyncio.to_thread(form_index.ensure_loaded)
+    form_ids = form_index.search(query_embedding)
+    if not form_ids:
+        raise ValueError("No forms found in the form-struct-data collection")
+    return form_index.flattened(form_ids[0])
 
 
 def process_and_store_json_file(file_path):
@@ -145,6 +425,10 @@ def process_and_store_json_file(file_path):
 
 
 BACKEND_URL = os.environ.get("BACKEND_URL")
+PROFILE_TIMEOUT_SECONDS = float(os.environ.get("PROFILE_TIMEOUT_SECONDS", "5"))
+
+# Reuses connections to BACKEND_URL across calls
+_profile_session = requests.Session()
 
 
 def get_user_profile(user_id):
@@ -167,7 +451,9 @@ def get_user_profile(user_id):
         }
 
         # Make the API request
-        response = requests.get(url, headers=headers)
+        response = _profile_session.get(
+            url, headers=headers, timeout=PROFILE_TIMEOUT_SECONDS
+        )
 
         # Check if the request was successful
         if response.status_code == 200:
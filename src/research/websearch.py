@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cache import SingleFlight, normalize_question
+from cassette import CACHES_ENABLED
+from packing import fit_budget, normalize_text, select_chunks, split_text
+from tools import embeddings, web_search_tool
+
+logger = logging.getLogger(__name__)
+
+# Web results are split into chunks of about WEB_CHUNK_SIZE characters, and
+# only the chunks closest to the question that fit in WEB_TOKEN_BUDGET
+# estimated tokens go into the documents. Chunks at least
+# WEB_DUPLICATE_THRESHOLD similar to a chunk already kept are dropped.
+WEB_CHUNK_SIZE = int(os.environ.get("WEB_CHUNK_SIZE", "600"))
+WEB_TOKEN_BUDGET = int(os.environ.get("WEB_TOKEN_BUDGET", "1200"))
+WEB_DUPLICATE_THRESHOLD = float(os.environ.get("WEB_DUPLICATE_THRESHOLD", "0.92"))
+WEB_SEARCH_CACHE_TTL = float(os.environ.get("WEB_SEARCH_CACHE_TTL", "600"))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(
+    os.environ.get("WEB_SEARCH_CACHE_MAX_ENTRIES", "512")
+)
+
+
+class WebSearchCache:
+    """
+    Tavily results per normalized query, expiring after ttl_seconds and
+    evicted least recently used first once max_entries is reached.
+    Concurrent async searches for the same query share one Tavily call.
+    """
+
+    def __init__(self, tool, ttl_seconds, max_entries):
+        self.tool = tool
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def search(self, query):
+        """
+        Args:
+            query (str): The search query
+
+        Returns:
+            list: Tavily results, dicts with "url" and "content"
+        """
+        key = normalize_question(query)
+        results = self._get(key)
+        if results is None:
+            results = self.tool.invoke({"query": query})
+            self._put(key, results)
+        return results
+
+    async def asearch(self, query):
+        """
+        Async version of search.
+        """
+        key = normalize_question(query)
+        results = self._get(key)
+        if results is None:
+            results, _ = await self._single_flight.run(
+                key, lambda: self._afetch(key, query)
+            )
+        return results
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters and current size of the cache
+        """
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
+
+    async def _afetch(self, key, query):
+        results = await self.tool.ainvoke({"query": query})
+        self._put(key, results)
+        return results
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def _put(self, key, results):
+        if not results or not isinstance(results, list):
+            # Empty results and error strings are worth retrying
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Nothing is kept while a cassette records or replays
+web_search_cache = WebSearchCache(
+    web_search_tool,
+    WEB_SEARCH_CACHE_TTL,
+    WEB_SEARCH_CACHE_MAX_ENTRIES if CACHES_ENABLED else 0,
+)
+
+
+def web_chunks(results, documents):
+    """
+    Split search results into chunks, dropping exact duplicates and chunks
+    already in documents.
+    """
+    seen = {normalize_text(d) for d in documents if isinstance(d, str)}
+    chunks = []
+    for result in results:
+        for chunk in split_text(result.get("content") or "", WEB_CHUNK_SIZE):
+            key = normalize_text(chunk)
+            if key not in seen:
+                seen.add(key)
+                chunks.append(chunk)
+    return chunks
+
+
+def rank_web_results(question, results, documents):
+    """
+    The chunks of the search results worth adding to documents: split,
+    deduplicated, ranked by similarity to the question and cut to
+    WEB_TOKEN_BUDGET.
+
+    Args:
+        question (str): The user question
+        results (list): Tavily results
+        documents (list): Documents already in the state
+
+    Returns:
+        list: Chunk texts, most relevant first
+    """
+    chunks = web_chunks(results, documents)
+    try:
+        picked = select_chunks(
+            embeddings.embed_query(question),
+            embeddings.embed_documents(chunks) if chunks else [],
+            chunks,
+            WEB_TOKEN_BUDGET,
+            WEB_DUPLICATE_THRESHOLD,
+        )
+    except Exception as e:
+        logger.warning("web result ranking failed", extra={"error": str(e)})
+        return fit_budget(chunks, WEB_TOKEN_BUDGET)
+    return [chunks[i] for i in picked]
+
+
+async def arank_web_results(question, results, documents):
+    """
+    Async version of rank_web_results.
+    """
+    chunks = web_chunks(results, documents)
+    try:
+        picked = select_chunks(
+            await embeddings.aembed_query(question),
+            await embeddings.aembed_documents(chunks) if chunks else [],
+            chunks,
+            WEB_TOKEN_BUDGET,
+            WEB_DUPLICATE_THRESHOLD,
+        )
+    except Exception as e:
+        logger.warning("web result ranking failed", extra={"error": str(e)})
+        return fit_budget(chunks, WEB_TOKEN_BUDGET)
+    return [chunks[i] for i in picked]